@@ -0,0 +1,255 @@
+"""
+Stand-ins for the discord.py objects the bot touches: guilds, members, roles,
+channels and messages, plus FakeREST which every REST call goes through.
+Shared by the benchmarks and the end-to-end harness.
+"""
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+
+import discord
+
+from bot.bot import BOT
+from bot.metrics import current_command
+
+# Route -> (requests, per seconds), per channel / guild like Discord's buckets
+BUCKETS = {
+    "POST /channels/{channel_id}/messages": (5, 5.0),
+    "PATCH /channels/{channel_id}/messages/{message_id}": (5, 5.0),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0),
+    "GET /channels/{channel_id}/messages": (5, 5.0),
+    "PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me": (1, 0.25),
+    "POST /guilds/{guild_id}/channels": (5, 10.0),
+    "PATCH /guilds/{guild_id}/members/{user_id}": (10, 10.0),
+    "GET /users/{user_id}": (30, 1.0),
+}
+GLOBAL_BUCKET = (50, 1.0)
+
+ids = itertools.count(1_000_000_000_000_000)
+
+
+@dataclass
+class Call:
+    method: str
+    route: str
+    major: int | None
+    command: str
+    at: float
+    waited: float
+    limited: bool
+
+
+class FakeResponse:
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeREST:
+    """
+    Records every call and delays it like a 429 + Retry-After would once its
+    bucket (route + channel/guild) or the global bucket is exhausted.
+    `speed` shrinks every window, to run rate-limited scenarios faster.
+    """
+
+    def __init__(self, speed: float = 1.0, latency: float = 0.0):
+        self.speed = speed
+        self.latency = latency
+        self.calls: list[Call] = []
+        # bucket key -> (window start, requests in window)
+        self.windows: dict[tuple, tuple[float, int]] = {}
+
+    async def _take(self, key: tuple, limit: int, per: float) -> float:
+        per /= self.speed
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            start, used = self.windows.get(key, (now, 0))
+            if now - start >= per:
+                start, used = now, 0
+            if used < limit:
+                self.windows[key] = (start, used + 1)
+                return waited
+            await asyncio.sleep(start + per - now)
+            waited += start + per - now
+
+    async def call(self, method: str, route: str, major: int | None = None):
+        BOT.metrics.count("outbound_requests", "discord")
+        key = f"{method} {route}"
+        limit, per = BUCKETS.get(key, (50, 1.0))
+        waited = await self._take(("global",), *GLOBAL_BUCKET)
+        waited += await self._take((key, major), limit, per)
+        self.calls.append(
+            Call(method, route, major, current_command.get(), time.time(), waited, waited > 0)
+        )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+class FakeRole:
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+        self.members = []
+
+
+class FakeUser:
+    def __init__(self, id: int, name: str, bot: bool = False):
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{id}>"
+        self.display_avatar = None
+        self.default_avatar = FakeAsset()
+
+    def __str__(self):
+        return f"{self.name}#0"
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: "FakeGuild", id: int, name: str, roles: list[FakeRole], bot: bool = False):
+        super().__init__(id, name, bot)
+        self.guild = guild
+        self.roles = [guild.default_role, *roles]
+        self.premium_since = None
+
+    async def edit(self, nick: str | None = None, **kwargs):
+        await self.guild.rest.call("PATCH", "/guilds/{guild_id}/members/{user_id}", self.guild.id)
+        self.display_name = nick or self.name
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel", author: FakeUser, content: str = "", embed=None):
+        self.id = next(ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.embed = embed
+
+    async def reply(self, content: str | None = None, embed=None, **kwargs):
+        return await self.channel.send(content=content, embed=embed)
+
+    async def edit(self, content: str | None = None, embed=None, **kwargs):
+        await self.channel.get_partial_message(self.id).edit(content=content, embed=embed)
+        return self
+
+    async def delete(self):
+        await self.channel.get_partial_message(self.id).delete()
+
+    async def add_reaction(self, emoji: str):
+        await self.channel.rest.call(
+            "PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", self.channel.id
+        )
+
+
+class FakePartialMessage:
+    def __init__(self, channel: "FakeTextChannel", id: int):
+        self.channel = channel
+        self.id = id
+
+    def _message(self) -> FakeMessage:
+        message = self.channel.messages.get(self.id)
+        if not message:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Message")
+        return message
+
+    async def edit(self, content: str | None = None, embed=None, **kwargs):
+        await self.channel.rest.call(
+            "PATCH", "/channels/{channel_id}/messages/{message_id}", self.channel.id
+        )
+        message = self._message()
+        if content is not None:
+            message.content = content
+        if embed is not None:
+            message.embed = embed
+        return message
+
+    async def delete(self):
+        await self.channel.rest.call(
+            "DELETE", "/channels/{channel_id}/messages/{message_id}", self.channel.id
+        )
+        self._message()
+        del self.channel.messages[self.id]
+
+
+class FakeHistory:
+    def __init__(self, channel: "FakeTextChannel", limit: int, oldest_first: bool):
+        self.channel = channel
+        self.limit = limit
+        self.oldest_first = oldest_first
+        self.predicate = None
+
+    def filter(self, predicate):
+        self.predicate = predicate
+        return self
+
+    async def flatten(self) -> list[FakeMessage]:
+        await self.channel.rest.call("GET", "/channels/{channel_id}/messages", self.channel.id)
+        messages = list(self.channel.messages.values())
+        messages = messages[: self.limit] if self.oldest_first else messages[::-1][: self.limit]
+        return [m for m in messages if not self.predicate or self.predicate(m)]
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", name: str):
+        self.id = next(ids)
+        self.guild = guild
+        self.name = name
+        self.rest = guild.rest
+        self.messages: dict[int, FakeMessage] = {}
+        # Like Discord, not rolled back when the message is deleted
+        self.last_message_id: int | None = None
+
+    async def send(self, content: str | None = None, embed=None, **kwargs) -> FakeMessage:
+        await self.rest.call("POST", "/channels/{channel_id}/messages", self.id)
+        message = FakeMessage(self, BOT.user, content, embed)
+        self.messages[message.id] = message
+        self.last_message_id = message.id
+        return message
+
+    def get_partial_message(self, id: int) -> FakePartialMessage:
+        return FakePartialMessage(self, id)
+
+    def history(self, limit: int = 100, oldest_first: bool = False) -> FakeHistory:
+        return FakeHistory(self, limit, oldest_first)
+
+
+class FakeGuild:
+    def __init__(self, rest: FakeREST, id: int, name: str):
+        self.rest = rest
+        self.id = id
+        self.name = name
+        self.icon = None
+        self.default_role = FakeRole(id, "@everyone")
+        self.roles = [self.default_role]
+        self.members: list[FakeMember] = []
+        self.text_channels: list[FakeTextChannel] = []
+        self.premium_subscribers: list[FakeMember] = []
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def get_member(self, id: int) -> FakeMember | None:
+        return next((m for m in self.members if m.id == id), None)
+
+    def add_member(self, id: int, name: str, roles: list[FakeRole], bot: bool = False) -> FakeMember:
+        member = FakeMember(self, id, name, roles, bot)
+        self.members.append(member)
+        for role in roles:
+            role.members.append(member)
+        return member
+
+    async def create_text_channel(self, name: str, overwrites=None, **kwargs) -> FakeTextChannel:
+        await self.rest.call("POST", "/guilds/{guild_id}/channels", self.id)
+        channel = FakeTextChannel(self, name)
+        self.text_channels.append(channel)
+        return channel
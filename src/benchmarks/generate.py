@@ -0,0 +1,140 @@
+"""
+Seeded generator for synthetic database.json files.
+
+    python -m benchmarks.generate 100000 --seed 1 -o ../bench-100k.json
+"""
+
+import argparse
+import json
+import random
+import string
+import uuid
+
+ROLES = [
+    ("Leader", ":crown:"),
+    ("Co-Leader", ":crown:"),
+    ("Developer", ":computer:"),
+    ("Moderator", ":shield:"),
+    ("Helper", ":shield:"),
+    ("Recruiter", ":children_crossing:"),
+    ("Tank II", ":crossed_swords:"),
+    ("Tank I", ":crossed_swords:"),
+    ("Knights II", ":adult:"),
+    ("Member", ":adult:"),
+    ("Ally", ":handshake:"),
+    ("Rookie", ":baby:"),
+    ("Offline", ":sleeping:"),
+    ("Neutral", ":thumbsup:"),
+]
+# Relative weight of each role above, most players are rank and file
+ROLE_WEIGHTS = [1, 2, 1, 3, 4, 3, 8, 10, 20, 60, 10, 30, 15, 5]
+CLANS = 5
+# Share of players that are alts, and how deep alt chains go
+ALT_RATIO = 0.2
+ALT_DEPTH = 3
+HIDDEN_RATIO = 0.3
+SECONDARY_RATIO = 0.1
+
+
+def generate_name(rng: random.Random, taken: set[str]) -> str:
+    alphabet = string.ascii_letters + string.digits + "_"
+    while True:
+        name = "".join(rng.choices(alphabet, k=rng.randint(3, 16)))
+        if name.lower() not in taken:
+            taken.add(name.lower())
+            return name
+
+
+def generate_clans(rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": clan,
+            "name": f"Clan{clan}",
+            "guild": rng.getrandbits(60),
+            "roles": [
+                {"id": role, "name": name, "icon": icon, "discord": rng.getrandbits(60)}
+                for role, (name, icon) in enumerate(ROLES)
+            ],
+        }
+        for clan in range(CLANS)
+    ]
+
+
+def generate(players: int, seed: int = 0) -> dict:
+    """
+    :return: a database.json document with `players` players spread over
+    CLANS clans, about ALT_RATIO of them alts chained up to ALT_DEPTH deep.
+    """
+    rng = random.Random(seed)
+    clans = generate_clans(rng)
+    relations = [
+        [0 if i == j else rng.choice([1, 2, 3]) for j in range(CLANS)]
+        for i in range(CLANS)
+    ]
+    taken: set[str] = set()
+    mains: list[dict] = []
+    result = []
+    now = 1_700_000_000.0
+    for _ in range(players):
+        clan = rng.randrange(CLANS)
+        clans_of = [
+            {
+                "clan": clan,
+                "primary": True,
+                "role": rng.choices(range(len(ROLES)), ROLE_WEIGHTS)[0],
+            }
+        ]
+        if rng.random() < SECONDARY_RATIO:
+            clans_of.append(
+                {
+                    "clan": (clan + rng.randrange(1, CLANS)) % CLANS,
+                    "primary": False,
+                    "role": rng.choices(range(len(ROLES)), ROLE_WEIGHTS)[0],
+                }
+            )
+        player = {
+            "parents": None,
+            "uuid": uuid.UUID(int=rng.getrandbits(128), version=4).hex,
+            "name": generate_name(rng, taken),
+            "hidden": False,
+            "last_updated": now - rng.random() * 30 * 24 * 3600,
+            "discord": rng.getrandbits(60),
+            "slug": None,
+            "clans": clans_of,
+        }
+        if mains and rng.random() < ALT_RATIO:
+            parent = rng.choice(mains)
+            chain = [parent["uuid"], *(parent["parents"] or [])][:ALT_DEPTH]
+            player["parents"] = chain
+            player["hidden"] = rng.random() < HIDDEN_RATIO
+            player["discord"] = parent["discord"]
+            player["clans"] = [dict(i) for i in parent["clans"]]
+            if len(chain) < ALT_DEPTH:
+                mains.append(player)
+        else:
+            mains.append(player)
+        result.append(player)
+
+    return {
+        "token": "<HIDDEN>",
+        "home": rng.getrandbits(60),
+        "perm_level": {"root": [], "manager": []},
+        "clans": clans,
+        "clan_relations": relations,
+        "players": result,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("players", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="-")
+    options = parser.parse_args()
+
+    data = generate(options.players, options.seed)
+    if options.output == "-":
+        print(json.dumps(data))
+    else:
+        with open(options.output, "w") as fp:
+            json.dump(data, fp)
@@ -0,0 +1,288 @@
+"""
+In-process stand-in for the Discord gateway/REST layer and the Mojang API,
+to run commands end to end offline and measure their latency and API calls.
+
+    python -m benchmarks.harness --players 10000 --links 100 -o ../harness.json
+
+Fake guilds, members, roles and channels replace the gateway cache, every
+REST call (send/edit/delete/history/fetch_user/...) goes through FakeREST,
+which records it and enforces simulated per-route rate-limit buckets, and
+the shared httpx client talks to MojangStub through httpx.MockTransport.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+
+import discord  # noqa: E402
+
+import bot  # noqa: E402
+import bot.bot as core  # noqa: E402
+from bot.bot import BOT, Database  # noqa: E402
+from bot.events import on_message  # noqa: E402
+from bot.metrics import Metrics  # noqa: E402
+from bot.mojang import ProfileCache  # noqa: E402
+from bot.roster import RosterRecords, RouteScheduler  # noqa: E402
+
+from .fakes import (  # noqa: E402
+    FakeGuild,
+    FakeMessage,
+    FakeResponse,
+    FakeREST,
+    FakeRole,
+    FakeTextChannel,
+    FakeUser,
+    ids,
+)
+from .generate import generate  # noqa: E402
+
+
+class MojangStub:
+    """
+    Answers the profile, name and bulk lookups from a fixed set of profiles.
+    """
+
+    def __init__(self, profiles: dict[str, str]):
+        # lowercased name -> (uuid, name)
+        self.by_name = {name.lower(): (uuid, name) for uuid, name in profiles.items()}
+        self.by_uuid = profiles
+        self.requests = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        path = request.url.path
+        if path.startswith("/users/profiles/minecraft/"):
+            found = self.by_name.get(path.rsplit("/", 1)[1].lower())
+            if not found:
+                return httpx.Response(404)
+            return httpx.Response(200, json={"id": found[0], "name": found[1]})
+        if path.startswith("/user/profile/"):
+            uuid = path.rsplit("/", 1)[1]
+            if uuid not in self.by_uuid:
+                return httpx.Response(404)
+            return httpx.Response(200, json={"id": uuid, "name": self.by_uuid[uuid]})
+        if path.endswith("/bulk/byname"):
+            names = json.loads(request.content)
+            return httpx.Response(
+                200,
+                json=[
+                    {"id": self.by_name[i.lower()][0], "name": self.by_name[i.lower()][1]}
+                    for i in names
+                    if i.lower() in self.by_name
+                ],
+            )
+        return httpx.Response(404)
+
+
+class Harness:
+    """
+    Points BOT at a synthetic database and fake guilds (one per clan plus the
+    home guild). Messages sent with send() go through the real on_message.
+    """
+
+    def __init__(
+        self,
+        players: int = 1000,
+        seed: int = 0,
+        unlinked: int = 100,
+        speed: float = 1.0,
+        workdir: str | None = None,
+    ):
+        self.rng = random.Random(seed)
+        self.workdir = workdir or tempfile.mkdtemp(prefix="gideon-harness-")
+        self.rest = FakeREST(speed)
+        core.__db__ = os.path.join(self.workdir, "database.json")
+        core.__journal__ = os.path.join(self.workdir, "database.journal")
+        core.__snapshot__ = os.path.join(self.workdir, "database.snapshot")
+
+        data = generate(players, seed)
+        self.admin = FakeUser(next(ids), "admin")
+        data["perm_level"] = {"root": [self.admin.id], "manager": []}
+        BOT.db = Database(data)
+        BOT.metrics = Metrics()
+        BOT.memory = ["hello"]
+        BOT.ready_status = True
+        BOT.rosters = RosterRecords(os.path.join(self.workdir, "rosters.json"))
+        BOT.routes = RouteScheduler(
+            global_rate=50 * speed, channel_rate=1 * speed, channel_burst=5
+        )
+        BOT._connection.user = FakeUser(next(ids), "Gideon", bot=True)
+
+        self.users: dict[int, FakeUser] = {self.admin.id: self.admin}
+        self.guilds: dict[int, FakeGuild] = {}
+        home = self.guild(BOT.db.home, "Home")
+        home.add_member(self.admin.id, self.admin.name, [])
+        for clan in BOT.db.clans.__list__():
+            guild = self.guilds.get(clan.guild) or self.guild(clan.guild, clan.name)
+            guild.add_member(self.admin.id, self.admin.name, [])
+            self.populate(guild, clan, unlinked)
+        BOT._connection._guilds = self.guilds
+        BOT.get_user = lambda id: None
+        BOT.fetch_user = self.fetch_user
+
+        # Mojang knows every player, plus the unlinked members' names
+        self.mojang = MojangStub(
+            {
+                **{p.uuid: p.name for p in BOT.db.players.__list__()},
+                **{
+                    f"{m.id:032x}": m.display_name.split(" ")[0]
+                    for g in self.guilds.values()
+                    for m in g.members
+                    if not BOT.db.players.find_by_discord(m.id)
+                },
+            }
+        )
+        BOT.profiles = ProfileCache(os.path.join(self.workdir, "profiles.sqlite"))
+
+    def guild(self, id: int, name: str) -> FakeGuild:
+        guild = self.guilds[id] = FakeGuild(self.rest, id, name)
+        return guild
+
+    def populate(self, guild: FakeGuild, clan: Database.Clans.Clan, unlinked: int):
+        roles = {role.id: FakeRole(role.discord, role.name) for role in clan.roles.__list__()}
+        guild.roles.extend(roles.values())
+        seen = set()
+        for player in BOT.db.players.in_clan(clan.id):
+            if player.parents or player.discord in seen:
+                continue
+            seen.add(player.discord)
+            membership = next(i for i in player.clans.__list__() if i.clan == clan.id)
+            role = roles.get(membership.role)
+            if self.rng.random() < 0.05:
+                role = self.rng.choice(list(roles.values()))
+            member = guild.add_member(player.discord, f"{player.name} [{clan.name}]", [role])
+            self.users[member.id] = member
+        for i in range(unlinked):
+            member = guild.add_member(
+                next(ids), f"New{guild.id % 1000}x{i}", [self.rng.choice(list(roles.values()))]
+            )
+            self.users[member.id] = member
+        guild.premium_subscribers = guild.members[: len(guild.members) // 50]
+
+    async def fetch_user(self, id: int) -> FakeUser:
+        await self.rest.call("GET", "/users/{user_id}")
+        if id not in self.users:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown User")
+        return self.users[id]
+
+    def channel(self, guild: FakeGuild) -> FakeTextChannel:
+        for channel in guild.text_channels:
+            if channel.name == "commands":
+                return channel
+        channel = FakeTextChannel(guild, "commands")
+        guild.text_channels.append(channel)
+        return channel
+
+    async def send(self, guild: FakeGuild, content: str, author: FakeUser | None = None) -> float:
+        """
+        Delivers a message to on_message.
+        :return: seconds until the handler returned
+        """
+        message = FakeMessage(self.channel(guild), author or self.admin, content)
+        start = time.perf_counter()
+        await on_message(message)
+        return time.perf_counter() - start
+
+    async def start(self):
+        BOT.web = httpx.AsyncClient(
+            transport=httpx.MockTransport(self.mojang.handle),
+            event_hooks={"request": [BOT.metrics.on_request]},
+        )
+
+    async def close(self):
+        await BOT.web.aclose()
+        BOT.profiles.close()
+        BOT.rosters = RosterRecords(os.path.join(BOT.path, "rosters.json"))
+
+    def report(self) -> dict:
+        """
+        :return: command -> latency summary and recorded REST calls
+        """
+        result = {}
+        for name, histogram in BOT.metrics.commands.items():
+            calls = [c for c in self.rest.calls if c.command == name]
+            result[name] = {
+                "runs": histogram.count,
+                "total": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "max": histogram.max,
+                "rest_calls": len(calls),
+                "rate_limited": sum(c.limited for c in calls),
+                "rate_limit_wait": sum(c.waited for c in calls),
+                "routes": {
+                    route: sum(1 for c in calls if f"{c.method} {c.route}" == route)
+                    for route in sorted({f"{c.method} {c.route}" for c in calls})
+                },
+                "outbound": {
+                    target: value
+                    for (counter, target, command), value in BOT.metrics.counters.items()
+                    if counter == "outbound_requests" and command == name
+                },
+            }
+        return result
+
+
+async def scenario(harness: Harness, links: int) -> dict:
+    """
+    gd:refresh in every clan guild (twice, the second run only edits what
+    changed), gd:sync, gd:gideon and a gd:link flood, one message per link
+    and then the same amount in a single message.
+    """
+    await harness.start()
+    clans = BOT.db.clans.__list__()
+    for _ in range(2):
+        for clan in clans:
+            await harness.send(harness.guilds[clan.guild], "gd:refresh")
+    for clan in clans:
+        await harness.send(harness.guilds[clan.guild], "gd:sync")
+    await harness.send(harness.guilds[BOT.db.home], "gd:gideon")
+
+    guild = harness.guilds[clans[0].guild]
+    unlinked = [m for m in guild.members if m.name.startswith("New")]
+    single, bulk = unlinked[: links // 2], unlinked[links // 2 : links]
+    role = clans[0].roles.__list__()[-1].name.replace(" ", "_")
+    for member in single:
+        await harness.send(guild, f"gd:link {member.id} {member.name} {clans[0].name} {role}")
+    await harness.send(
+        guild,
+        "\n".join(f"gd:link {m.id} {m.name} {clans[0].name} {role}" for m in bulk),
+    )
+    report = harness.report()
+    await harness.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--links", type=int, default=50)
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("-o", "--output", default="harness.json")
+    options = parser.parse_args()
+
+    harness = Harness(
+        options.players, options.seed, unlinked=options.links, speed=options.speed
+    )
+    report = asyncio.run(scenario(harness, options.links))
+    for name, result in report.items():
+        print(
+            f"--> {name}: {result['runs']} runs, p50 {result['p50']:.3f}s, "
+            f"{result['rest_calls']} REST calls ({result['rate_limited']} rate-limited)"
+        )
+    with open(options.output, "w") as fp:
+        json.dump(
+            {"players": options.players, "seed": options.seed, "commands": report},
+            fp,
+            indent=4,
+        )
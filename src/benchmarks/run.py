@@ -0,0 +1,199 @@
+"""
+Times the database and roster hot paths against synthetic databases and
+writes the results as JSON, to compare runs across versions.
+
+    python -m benchmarks.run --sizes 1000 10000 -o ../bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+
+import bot  # noqa: E402
+import bot.bot as core  # noqa: E402
+from bot.__utils__ import print_roster  # noqa: E402
+from bot.bot import BOT, Database  # noqa: E402
+from bot.commands import Command  # noqa: E402
+from bot.sync import sync_guild  # noqa: E402
+
+from .fakes import FakeGuild, FakeREST, FakeRole, FakeTextChannel  # noqa: E402
+from .generate import generate  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# Lookups per find_* measurement
+LOOKUPS = 1000
+
+
+def fake_guild(rng: random.Random, clan: Database.Clans.Clan, players: list) -> FakeGuild:
+    """
+    Members of `clan`'s guild: its linked players (a few with a different
+    role than the database has), plus as many unlinked members again.
+    """
+    guild = FakeGuild(FakeREST(), clan.guild, clan.name)
+    roles = [FakeRole(role.discord, role.name) for role in clan.roles.__list__()]
+    guild.roles.extend(roles)
+    seen = set()
+    for player in players:
+        if player.parents or player.discord in seen:
+            continue
+        seen.add(player.discord)
+        membership = next(i for i in player.clans.__list__() if i.clan == clan.id)
+        role = roles[membership.role]
+        if rng.random() < 0.05:
+            role = rng.choice(roles)
+        guild.add_member(player.discord, f"{player.name} [{clan.name}]", [role])
+    for i in range(len(guild.members)):
+        guild.add_member(
+            rng.getrandbits(60),
+            f"Guest{i} | {rng.choice(roles).name}",
+            rng.sample(roles, rng.randint(0, 2)),
+            bot=rng.random() < 0.01,
+        )
+    guild.premium_subscribers = guild.members[: len(guild.members) // 50]
+    return guild
+
+
+def measure(fn, repeat: int, per: int = 1, setup=None) -> dict:
+    """
+    :param setup: called untimed before every run
+    :return: min / median / mean seconds of `repeat` runs, divided by `per` operations
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) / per)
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+        "runs": repeat,
+        "ops": per,
+    }
+
+
+def bench_size(size: int, seed: int, repeat: int, workdir: str) -> dict:
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    data = generate(size, seed)
+    results = {"generate": {"min": time.perf_counter() - start, "runs": 1, "ops": 1}}
+
+    path = os.path.join(workdir, f"database-{size}.json")
+    with open(path, "w") as fp:
+        json.dump(data, fp)
+    core.__db__ = path
+    core.__journal__ = os.path.join(workdir, "database.journal")
+    core.__snapshot__ = os.path.join(workdir, "database.snapshot")
+
+    def load():
+        with open(path, "r") as fp:
+            BOT.db = Database(json.load(fp))
+
+    results["startup_load"] = measure(load, repeat)
+    db = BOT.db
+    players = db.players.__list__()
+
+    names = [rng.choice(players).name.lower() for _ in range(LOOKUPS)]
+    uuids = [rng.choice(players).uuid for _ in range(LOOKUPS)]
+    discords = [rng.choice(players).discord for _ in range(LOOKUPS)]
+    mains = [p.uuid for p in rng.sample(players, min(LOOKUPS, len(players))) if not p.parents]
+    results["find_by_ign"] = measure(
+        lambda: [db.players.find_by_ign(i) for i in names], repeat, LOOKUPS
+    )
+    results["find_by_uuid"] = measure(
+        lambda: [db.players.find_by_uuid(i) for i in uuids], repeat, LOOKUPS
+    )
+    results["find_by_discord"] = measure(
+        lambda: [db.players.find_by_discord(i) for i in discords], repeat, LOOKUPS
+    )
+    results["get_alts_by_uuid"] = measure(
+        lambda: [db.players.get_alts_by_uuid(i) for i in mains], repeat, len(mains)
+    )
+
+    clan = db.clans.get(0)
+    in_clan = db.players.in_clan(clan.id)
+    guild = fake_guild(rng, clan, in_clan)
+    channel = FakeTextChannel(guild, "roster")
+    results["print_roster"] = measure(
+        lambda: asyncio.run(
+            print_roster(
+                time.time(), db.clan_relations, 0, clan, channel, db.clans, in_clan, BOT
+            )
+        ),
+        repeat,
+    )
+    # sync_guild() writes the role changes, every run starts from the generated database
+    results["sync_guild"] = measure(
+        lambda: sync_guild(BOT.db, BOT.db.clans.get(clan.id), guild), repeat, setup=load
+    )
+    BOT.db = db
+    results["gen_candidates"] = measure(
+        lambda: Command.gen_candidates(clan, guild.members, len(guild.members)), repeat
+    )
+
+    for snapshot in ("json", "binary"):
+        db.snapshot = snapshot
+
+        def save():
+            db.dirty = True
+            db.flush()
+
+        results[f"save_{snapshot}"] = measure(save, repeat)
+    with open(path, "r") as fp:
+        config = json.load(fp)
+
+    def open_binary():
+        BOT.db = Database.open(config)
+        len(BOT.db.players)
+
+    results["startup_load_binary"] = measure(open_binary, repeat)
+    return results
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", default="bench.json")
+    options = parser.parse_args()
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.time(),
+        "seed": options.seed,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in options.sizes:
+            print(f"--> {size} players")
+            report["results"][str(size)] = bench_size(
+                size, options.seed, options.repeat, workdir
+            )
+            for name, result in report["results"][str(size)].items():
+                print(f"    {name}: {result['min'] * 1000:.3f}ms")
+    with open(options.output, "w") as fp:
+        json.dump(report, fp, indent=4)
@@ -1,6 +1,7 @@
+import asyncio
+import functools
 import re
 import time
-from dataclasses import dataclass
 
 import discord
 
@@ -129,6 +130,37 @@ class PlayerType:
         return self.clans
 
 
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, delay: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.updated = self.paused_until
+        self.tokens = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
 def get_icon(member: discord.Member):
     if not member:
         return ""
@@ -145,14 +177,62 @@ def get_name(member: discord.Member):
 
 
 def strip_name(member: discord.Member):
+    return strip_display_name(member.display_name)
+
+
+@functools.lru_cache(maxsize=65536)
+def strip_display_name(display_name: str):
     return (
-        re.sub(r"\[(.*?)\]", "", re.sub(r"\([^()]*\)", "", member.display_name))
+        re.sub(r"\[(.*?)\]", "", re.sub(r"\([^()]*\)", "", display_name))
         .split("|")[0]
         .split(" ")[0]
         .replace(".", "")
     )
 
 
+def chunk_lines(lines: list[str], limit: int) -> list[str]:
+    """
+    Joins lines with newlines into as few messages of at most `limit` characters as possible.
+    """
+    messages: list[list[str]] = [[]]
+    length = 0
+    for line in lines:
+        line = line[:limit]
+        if messages[-1] and length + 1 + len(line) > limit:
+            messages.append([])
+            length = 0
+        length += len(line) + (1 if messages[-1] else 0)
+        messages[-1].append(line)
+    return ["\n".join(parts) for parts in messages if parts]
+
+
+def chunk_roster(header: str, sections: list[tuple[str, list[str]]], limit: int = 1900):
+    """
+    Splits roster sections into messages, starting a new one whenever the
+    current message grows past `limit` characters.
+    """
+    messages: list[list[str]] = [[header]]
+    length = len(header)
+    for title, names in sections:
+        if length > limit:
+            messages.append([])
+            length = 0
+        messages[-1].append(title)
+        length += len(title)
+        after_title = True
+        for name in names:
+            if length > limit:
+                messages.append([])
+                length = 0
+            elif not after_title:
+                messages[-1].append(", ")
+                length += 2
+            messages[-1].append(name)
+            length += len(name)
+            after_title = False
+    return ["".join(parts) for parts in messages]
+
+
 async def print_roster(
     last_updated: float,
     relations: list[list[int]],
@@ -163,17 +243,11 @@ async def print_roster(
     db_players: list[PlayerType],
     BOT
 ):
-    @dataclass
-    class RosterPlayer:
-        name: str
-        role: ClanType.Roles.Role
-
     enemies = [clans.get(i).name for i, r in enumerate(relations[index]) if r == 3]
     allies = [clans.get(i).name for i, r in enumerate(relations[index]) if r == 2]
     neutrals = [clans.get(i).name for i, r in enumerate(relations[index]) if r == 1]
 
-    players: list[RosterPlayer] = []
-    messages = [
+    header = (
         f"> ## - Roster of {clan.name}\n"
         f"> **Last updated** <t:{round(time.time())}:R>\n"
         f"> **Usernames are up-to-date as of** <t:{round(last_updated)}:R>\n"
@@ -181,35 +255,38 @@ async def print_roster(
         f"> :small_blue_diamond: **Allied clans**: `{', '.join(allies) or '---'}`\n"
         f"> :white_small_square: **Neutral clans**: `{', '.join(neutrals) or '---'}`\n"
         f"> *Rosters aren't 100% accurate. Feel free to message @bbfh to add/remove/edit somebody.*\n"
-    ]
-    roles = clan.roles.__list__()
-    roles.sort(key=lambda r: r.id)
-    for role in roles:
-        for player in [i for i in db_players if not i.parents and role.id in [j.role for j in i.clans.list if j.clan == clan.id]]:
-            name = player.name.replace("_", "\\_")
-            if player.discord in [i.id for i in channel.guild.premium_subscribers]:
-                name = "`✨ " + player.name + "`"
-            alts = BOT.db.players.get_alts_by_uuid(player.uuid)
-            if alts[0]:
-                name += f" (ALTS: {'|'.join([*[i.name for i in alts[0]]])})"
-            players.append(RosterPlayer(name, role))
+    )
 
-    for role in roles:
-        if not [i for i in [j.role.id for j in players] if i == role.id]:
+    # Index the clan once per render: role id -> players, premium ids, uuid -> public alts
+    by_role: dict[int, list[PlayerType]] = {}
+    for player in db_players:
+        if player.parents:
             continue
-        if len(messages[-1]) > 1900:
-            messages.append("")
-        messages[-1] += f"\n## - {role.icon} {role.name}:\n"
-        roster = [p for p in players if p.role.id == role.id]
-
-        while len(roster) > 0:
-            if len(messages[-1]) > 1900:
-                messages.append("")
-            while len(roster) > 0 and len(messages[-1]) <= 1900:
-                player = roster.pop()
-                if messages[-1] and messages[-1][-1] != "\n":
-                    messages[-1] += ", "
-                messages[-1] += player.name
+        for role_id in dict.fromkeys(j.role for j in player.clans.list if j.clan == clan.id):
+            by_role.setdefault(role_id, []).append(player)
+    premium = {i.id for i in channel.guild.premium_subscribers}
+    alts = {
+        player.uuid: BOT.db.players.get_alts_by_uuid(player.uuid)[0]
+        for players in by_role.values()
+        for player in players
+    }
+
+    sections = []
+    for role in sorted(clan.roles.__list__(), key=lambda r: r.id):
+        if role.id not in by_role:
+            continue
+        names = []
+        for player in by_role[role.id]:
+            name = player.name.replace("_", "\\_")
+            if player.discord in premium:
+                name = "`✨ " + player.name + "`"
+            if alts[player.uuid]:
+                name += f" (ALTS: {'|'.join([i.name for i in alts[player.uuid]])})"
+            names.append(name)
+        # Players are listed last-added first
+        names.reverse()
+        sections.append((f"\n## - {role.icon} {role.name}:\n", names))
+    messages = chunk_roster(header, sections)
 
     if channel.guild.id != 1120419648316395530:
         return [*messages, f"> All rosters are available at: https://discord.gg/77meGgDHQB !"]
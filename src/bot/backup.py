@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+# Average / maximum number of players per chunk
+CHUNK_RECORDS = 64
+CHUNK_LIMIT = 4 * CHUNK_RECORDS
+
+
+@dataclass
+class BackupResult:
+    name: str
+    players: int
+    chunks: int
+    # New chunks and their compressed size in bytes
+    written: int
+    size: int
+
+
+class BackupStore:
+    """
+    Content-addressed, incremental backups:
+
+        objects/ab/abcdef...   zlib-compressed chunk of player records (JSON lines)
+        manifests/NAME.json    config + ordered chunk hashes of one backup
+
+    Players are split into chunks at content-defined boundaries (the hash of a
+    record), so an edit, insert or removal only changes the chunks around it.
+    Chunks that already exist are not written again.
+    """
+
+    # Shared by every store: prune() must not delete the chunks of a backup
+    # whose manifest create() hasn't written yet
+    lock = threading.Lock()
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.manifests = os.path.join(root, "manifests")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.manifests, exist_ok=True)
+
+    def _object(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    @staticmethod
+    def _write(path: str, content: bytes):
+        with open(f"{path}.tmp", "wb") as fp:
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _store(self, lines: list[bytes]) -> tuple[str, int]:
+        """
+        :return: (HASH, BYTES WRITTEN)
+        """
+        content = b"\n".join(lines)
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(content)
+        self._write(path, compressed)
+        return digest, len(compressed)
+
+    def list(self) -> list[str]:
+        """
+        :return: backup names, oldest first
+        """
+        return sorted(
+            i.removesuffix(".json")
+            for i in os.listdir(self.manifests)
+            if i.endswith(".json")
+        )
+
+    def create(self, config: dict, players: list) -> BackupResult:
+        """
+        :param players: exported player records, as in Database.__export__()
+        """
+        with self.lock:
+            return self._create(config, players)
+
+    def _create(self, config: dict, players: list) -> BackupResult:
+        name = datetime.now().strftime("%Y%m%d-%H%M%S")
+        while os.path.exists(os.path.join(self.manifests, f"{name}.json")):
+            name = f"{name}-"
+        result = BackupResult(name, len(players), 0, 0, 0)
+        chunks = []
+        lines = []
+
+        def store():
+            digest, size = self._store(lines)
+            chunks.append(digest)
+            result.written += size > 0
+            result.size += size
+
+        for player in players:
+            line = json.dumps(player, sort_keys=True).encode()
+            lines.append(line)
+            boundary = int.from_bytes(hashlib.blake2b(line, digest_size=4).digest(), "big")
+            if boundary % CHUNK_RECORDS == 0 or len(lines) >= CHUNK_LIMIT:
+                store()
+                lines = []
+        if lines:
+            store()
+        result.chunks = len(chunks)
+
+        self._write(
+            os.path.join(self.manifests, f"{name}.json"),
+            json.dumps(
+                {
+                    "created": time.time(),
+                    "players": len(players),
+                    "config": config,
+                    "chunks": chunks,
+                }
+            ).encode(),
+        )
+        return result
+
+    def load(self, name: str) -> dict:
+        """
+        Rebuilds the database document (as exported by Database.__export__()) of a backup.
+        """
+        with open(os.path.join(self.manifests, f"{name}.json"), "r") as fp:
+            manifest = json.load(fp)
+        players = []
+        for digest in manifest.get("chunks"):
+            with open(self._object(digest), "rb") as fp:
+                content = zlib.decompress(fp.read())
+            if hashlib.sha256(content).hexdigest() != digest:
+                raise ValueError(f"Chunk {digest} of backup {name} is corrupted")
+            players.extend(json.loads(line) for line in content.split(b"\n"))
+        return {**manifest.get("config"), "players": players}
+
+    def prune(self, keep: int, days: int) -> int:
+        """
+        Keeps the `keep` newest backups plus the newest backup of each of the
+        last `days` days, then deletes chunks no remaining backup refers to.
+        :return: number of deleted backups
+        """
+        with self.lock:
+            return self._prune(keep, days)
+
+    def _prune(self, keep: int, days: int) -> int:
+        names = self.list()
+        kept = set(names[-keep:] if keep > 0 else [])
+        daily = {}
+        for name in names:
+            daily[name[:8]] = name
+        kept.update(sorted(daily.values())[-days:] if days > 0 else [])
+
+        removed = [name for name in names if name not in kept]
+        for name in removed:
+            os.remove(os.path.join(self.manifests, f"{name}.json"))
+
+        referenced = set()
+        for name in kept:
+            with open(os.path.join(self.manifests, f"{name}.json"), "r") as fp:
+                referenced.update(json.load(fp).get("chunks"))
+        for prefix in os.listdir(self.objects):
+            for digest in os.listdir(os.path.join(self.objects, prefix)):
+                if digest not in referenced:
+                    os.remove(os.path.join(self.objects, prefix, digest))
+        return len(removed)
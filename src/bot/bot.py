@@ -1,10 +1,23 @@
+import asyncio
+import contextlib
 import json
 import os
 import pathlib
+import sys
+import threading
 import time
 import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable
 
 import discord
+import httpx
+
+from .metrics import Metrics
+from .mojang import ProfileCache
+from .roster import RefreshScheduler, RosterRecords, RouteScheduler
+from .snapshot import encode_snapshot, read_snapshot, write_snapshot
 
 __db__ = os.path.join(
     os.path.dirname(os.path.realpath(__file__)),
@@ -12,6 +25,53 @@ __db__ = os.path.join(
     "..",
     "database.json",
 )
+__journal__ = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "..",
+    "..",
+    "database.journal",
+)
+__snapshot__ = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "..",
+    "..",
+    "database.snapshot",
+)
+
+def pack_uuid(value: str) -> bytes | str:
+    """
+    Stores a Mojang UUID as 16 bytes instead of a 32 character string.
+    Only strings unpack_uuid() gives back unchanged (32 lowercase hex digits)
+    are packed, anything else (dashed, uppercase, invalid) is kept as-is.
+    """
+    if not isinstance(value, str) or len(value) != 32:
+        return value
+    try:
+        packed = bytes.fromhex(value)
+    except ValueError:
+        return value
+    return packed if packed.hex() == value else value
+
+
+def unpack_uuid(value: bytes | str) -> str:
+    return value.hex() if isinstance(value, bytes) else value
+
+
+STAFF_KEYWORDS = ["leader", "staff", "mod", "helper", "owner", "found", "officer", "recruit"]
+
+
+@dataclass
+class ClanSize:
+    """
+    Players in a clan, and their membership entries broken down by role,
+    primary/secondary and mains/alts.
+    """
+    players: int = 0
+    mains: int = 0
+    alts: int = 0
+    primary: int = 0
+    secondary: int = 0
+    roles: dict[int, int] = field(default_factory=dict)
 
 
 class Database:
@@ -46,15 +106,50 @@ class Database:
 
                 def __init__(self, data: list[dict]):
                     self._list = [self.Role(entry) for entry in data]
+                    self.invalidate()
 
                 def __export__(self):
                     return [item.__export__() for item in self._list]
 
+                def invalidate(self):
+                    """
+                    Drops the derived indexes, call after editing the roles.
+                    """
+                    self._by_discord: dict[int, tuple[int, object]] | None = None
+                    self._by_id: dict[int, object] | None = None
+                    self._staff: set[int] | None = None
+
+                def resolve(self, discord_ids: set[int]) -> Role | None:
+                    """
+                    :return: the first role (in config order) out of the given Discord role ids
+                    """
+                    if self._by_discord is None:
+                        self._by_discord = {}
+                        for position, item in enumerate(self._list):
+                            self._by_discord.setdefault(item.discord, (position, item))
+                    matches = self._by_discord.keys() & discord_ids
+                    if not matches:
+                        return None
+                    return min((self._by_discord[i] for i in matches), key=lambda i: i[0])[1]
+
+                def staff(self) -> set[int]:
+                    """
+                    :return: ids of roles whose name looks like a staff role
+                    """
+                    if self._staff is None:
+                        self._staff = {
+                            item.id
+                            for item in self._list
+                            if any(i in item.name.lower() for i in STAFF_KEYWORDS)
+                        }
+                    return self._staff
+
                 def get(self, index: int) -> Role | None:
-                    for item in self._list:
-                        if item.id == index:
-                            return item
-                    return None
+                    if self._by_id is None:
+                        self._by_id = {}
+                        for item in self._list:
+                            self._by_id.setdefault(item.id, item)
+                    return self._by_id.get(index)
 
                 def get_name(self, index: int):
                     item = self.get(index)
@@ -79,6 +174,9 @@ class Database:
 
         def __init__(self, data: list[dict]):
             self._list = [self.Clan(entry) for entry in data]
+            # Bumped by invalidate(), memberships cache resolutions per version
+            self.version = 0
+            self.invalidate()
 
         def __export__(self):
             return [item.__export__() for item in self._list]
@@ -87,25 +185,35 @@ class Database:
             return self._list
 
         def get(self, index: int) -> Clan | None:
-            for item in self._list:
-                if item.id == index:
-                    return item
-            return None
+            return self._by_id.get(index)
 
         def find(self, name: str) -> Clan | None:
+            return self._by_name.get(name)
+
+        def invalidate(self):
+            """
+            Rebuilds the indexes, call after editing clans or their roles.
+            """
+            self._by_id: dict[int, Database.Clans.Clan] = {}
+            self._by_name: dict[str, Database.Clans.Clan] = {}
             for item in self._list:
-                if item.name.lower() == name:
-                    return item
-            return None
+                self._by_id.setdefault(item.id, item)
+                self._by_name.setdefault(item.name.lower(), item)
+                item.roles.invalidate()
+            self.version += 1
 
     class Players:
         class Player:
             class Clans:
                 class Clan:
+                    # _resolved: (Clans, version, clan, role), see resolve()
+                    __slots__ = ("clan", "primary", "role", "_resolved")
+
                     def __init__(self, data: dict):
                         self.clan: int = data.get("clan")
                         self.primary: bool = data.get("primary")
                         self.role: int = data.get("role")
+                        self._resolved = None
 
                     def __export__(self):
                         return {
@@ -114,11 +222,22 @@ class Database:
                             "role": self.role,
                         }
 
+                    def resolve(self) -> tuple:
+                        clans = BOT.db.clans
+                        cached = self._resolved
+                        if cached is None or cached[0] is not clans or cached[1] != clans.version:
+                            clan = clans.get(self.clan)
+                            role = clan.roles.get(self.role) if clan else None
+                            cached = self._resolved = (clans, clans.version, clan, role)
+                        return cached
+
                     def resolve_clan(self):
-                        return BOT.db.clans.get(self.clan)
+                        return self.resolve()[2]
 
                     def resolve_role(self):
-                        return BOT.db.clans.get(self.clan).roles.get(self.role)
+                        return self.resolve()[3]
+
+                __slots__ = ("list",)
 
                 def __init__(self, data: list[dict]):
                     self.list = [self.Clan(entry) for entry in data]
@@ -129,6 +248,21 @@ class Database:
                 def __export__(self):
                     return [item.__export__() for item in self.list]
 
+            # UUIDs are kept as 16 raw bytes and names are interned, see pack_uuid()
+            __slots__ = (
+                "raw_parents",
+                "raw_uuid",
+                "_name",
+                "hidden",
+                "last_updated",
+                "discord",
+                "slug",
+                "clans",
+                # Resolved main accounts and their merged clans, see Players.parents_of()
+                "_mains",
+                "_merged",
+            )
+
             def __init__(self, data: dict):
                 self.parents: list[str] | None = data.get("parents")
                 self.uuid: str = data.get("uuid")
@@ -138,6 +272,34 @@ class Database:
                 self.discord: int = data.get("discord")
                 self.slug: str = data.get("slug")
                 self.clans = self.Clans(data.get("clans"))
+                self._mains: list[Database.Players.Player] | None = None
+                self._merged: Database.Players.Player.Clans | None = None
+
+            @property
+            def uuid(self) -> str:
+                return unpack_uuid(self.raw_uuid)
+
+            @uuid.setter
+            def uuid(self, value: str):
+                self.raw_uuid = pack_uuid(value)
+
+            @property
+            def parents(self) -> list[str] | None:
+                if self.raw_parents is None:
+                    return None
+                return [unpack_uuid(i) for i in self.raw_parents]
+
+            @parents.setter
+            def parents(self, value: list[str] | None):
+                self.raw_parents = None if value is None else tuple(pack_uuid(i) for i in value)
+
+            @property
+            def name(self) -> str:
+                return self._name
+
+            @name.setter
+            def name(self, value: str):
+                self._name = sys.intern(value) if value else value
 
             def __export__(self):
                 return {
@@ -157,52 +319,41 @@ class Database:
                 return self.name
 
             def auto_discord(self):
-                if self.parents:
-                    return [
-                        BOT.db.players.find_by_uuid(parent).discord
-                        for parent in self.parents
-                    ]
+                if self.raw_parents:
+                    return [i.discord for i in BOT.db.players.parents_of(self)]
                 return self.discord
 
             def auto_slug(self):
-                if self.parents:
-                    return [
-                        BOT.db.players.find_by_uuid(parent).slug
-                        for parent in self.parents
-                    ]
+                if self.raw_parents:
+                    return [i.slug for i in BOT.db.players.parents_of(self)]
                 return self.slug
 
             def resolve_parent(self):
-                if not self.parents:
+                if not self.raw_parents:
                     return None
-                return [BOT.db.players.find_by_uuid(parent) for parent in self.parents]
+                return BOT.db.players.parents_of(self)
 
             def auto_clans(self):
-                if self.parents:
-                    merged = []
-                    for parent in self.parents:
-                        merged = [
-                            *merged,
-                            *BOT.db.players.find_by_uuid(parent).clans.__export__(),
-                        ]
-                    return self.Clans(merged)
+                if self.raw_parents:
+                    return BOT.db.players.merged_clans(self)
                 return self.clans
 
             def print_clans(self):
-                return [
-                    "- " + "??"
-                    if not clan.resolve_role()
-                    else clan.resolve_role().icon
-                    + " **"
-                    + ("__" if clan.primary else "")
-                    + clan.resolve_clan().name
-                    + ("__" if clan.primary else "")
-                    + f"** (`{'???' if not clan.resolve_role() else clan.resolve_role().name}`)"
-                    for clan in self.auto_clans().__list__()
-                ]
+                lines = []
+                for clan in self.auto_clans().__list__():
+                    _, _, resolved, role = clan.resolve()
+                    if not role:
+                        lines.append("- ??")
+                        continue
+                    underline = "__" if clan.primary else ""
+                    lines.append(
+                        f"{role.icon} **{underline}{resolved.name}{underline}** (`{role.name}`)"
+                    )
+                return lines
 
         def __init__(self, data: list[dict]):
             self._list = [self.Player(entry) for entry in data]
+            self.reindex()
 
         def __export__(self):
             return [item.__export__() for item in self._list]
@@ -210,72 +361,250 @@ class Database:
         def __list__(self):
             return self._list
 
+        def __len__(self):
+            return len(self._list)
+
+        def in_clan(self, clan: int) -> list[Player]:
+            return [
+                i for i in self._list if clan in [j.clan for j in i.clans.__list__()]
+            ]
+
+        def count_by_clan(self, clan: int) -> int:
+            return self._clan_players.get(clan, 0)
+
+        def breakdown(self, clan: int) -> ClanSize:
+            size = ClanSize(players=self.count_by_clan(clan))
+            for (role, primary, alt), count in self._memberships.get(clan, {}).items():
+                if not count:
+                    continue
+                size.roles[role] = size.roles.get(role, 0) + count
+                if primary:
+                    size.primary += count
+                else:
+                    size.secondary += count
+                if alt:
+                    size.alts += count
+                else:
+                    size.mains += count
+            return size
+
+        def reindex(self):
+            self._by_uuid: dict[bytes | str, Database.Players.Player] = {}
+            # A single player, or a list of them when the key is shared
+            self._by_ign: dict[str, Database.Players.Player | list] = {}
+            self._by_discord: dict[int, Database.Players.Player | list] = {}
+            self._by_parent: dict[bytes | str, list[Database.Players.Player]] = {}
+            # Clan -> players in it, clan -> (role, primary, alt) -> memberships
+            self._clan_players: Counter[int] = Counter()
+            self._memberships: dict[int, Counter[tuple[int, bool, bool]]] = {}
+            for player in self._list:
+                self._index(player)
+
+        def _index(self, player: Player):
+            self._by_uuid.setdefault(player.raw_uuid, player)
+            self._attach(self._by_ign, player.name.lower(), player)
+            self._attach(self._by_discord, player.discord, player)
+            for parent in player.raw_parents or []:
+                self._by_parent.setdefault(parent, []).append(player)
+            self._count(player, 1)
+
+        def _invalidate_alts(self, uuid: bytes | str):
+            """
+            Drops the cached mains / merged clans of the alts of `uuid`.
+            """
+            for alt in self._by_parent.get(uuid, ()):
+                alt._mains = None
+                alt._merged = None
+
+        def _unindex(self, player: Player):
+            if self._by_uuid.get(player.raw_uuid) is player:
+                del self._by_uuid[player.raw_uuid]
+            self._detach(self._by_ign, player.name.lower(), player)
+            self._detach(self._by_discord, player.discord, player)
+            for parent in player.raw_parents or []:
+                self._discard(self._by_parent, parent, player)
+            self._count(player, -1)
+
+        def _count(self, player: Player, delta: int):
+            for clan in {i.clan for i in player.clans.list}:
+                self._clan_players[clan] += delta
+            for i in player.clans.list:
+                self._count_membership(i, bool(player.raw_parents), delta)
+
+        def _count_membership(self, membership: Player.Clans.Clan, alt: bool, delta: int):
+            counter = self._memberships.setdefault(membership.clan, Counter())
+            counter[(membership.role, bool(membership.primary), alt)] += delta
+
+        @staticmethod
+        def _attach(index: dict, key, player: Player):
+            entry = index.get(key)
+            if entry is None:
+                index[key] = player
+            elif isinstance(entry, list):
+                entry.append(player)
+            else:
+                index[key] = [entry, player]
+
+        @staticmethod
+        def _detach(index: dict, key, player: Player):
+            entry = index.get(key)
+            if entry is player:
+                del index[key]
+            elif isinstance(entry, list):
+                entry[:] = [i for i in entry if i is not player]
+                if len(entry) == 1:
+                    index[key] = entry[0]
+
+        @staticmethod
+        def _first(index: dict, key) -> Player | None:
+            entry = index.get(key)
+            return entry[0] if isinstance(entry, list) else entry
+
+        @staticmethod
+        def _discard(index: dict, key, player: Player):
+            entries = index.get(key)
+            if not entries:
+                return
+            entries[:] = [entry for entry in entries if entry is not player]
+            if not entries:
+                del index[key]
+
+        def apply(self, record: dict) -> bool:
+            """
+            Applies a single journal record, see Database.commit().
+            :return: whether the record changed anything
+            """
+            match record.get("op"):
+                case "add":
+                    player = self.Player(record.get("player"))
+                    self._list.append(player)
+                    self._index(player)
+                    self._invalidate_alts(player.raw_uuid)
+                case "set":
+                    player = self._by_uuid.get(pack_uuid(record.get("uuid")))
+                    if not player:
+                        return False
+                    self._unindex(player)
+                    player.name = record.get("name")
+                    player.last_updated = record.get("last_updated")
+                    self._index(player)
+                case "update":
+                    player = self._by_uuid.get(pack_uuid(record.get("uuid")))
+                    if not player:
+                        return False
+                    self._unindex(player)
+                    player.discord = record.get("discord")
+                    player.clans.list.append(self.Player.Clans.Clan({
+                        "clan"   : record.get("clan"),
+                        "primary": False,
+                        "role"   : record.get("role"),
+                    }))
+                    self._index(player)
+                    self._invalidate_alts(player.raw_uuid)
+                case "modify":
+                    entry = self._by_uuid.get(pack_uuid(record.get("uuid")))
+                    if not entry:
+                        return False
+                    for c in entry.clans.__list__():
+                        if c.clan == record.get("clan"):
+                            alt = bool(entry.raw_parents)
+                            self._count_membership(c, alt, -1)
+                            c.role = record.get("role")
+                            c._resolved = None
+                            self._count_membership(c, alt, 1)
+                            return True
+                    return False
+                case "delete":
+                    uuid = pack_uuid(record.get("uuid"))
+                    for entry in [i for i in self._list if i.raw_uuid == uuid]:
+                        self._unindex(entry)
+                    self._list = [i for i in self._list if i.raw_uuid != uuid]
+                    self._invalidate_alts(uuid)
+                case "unify":
+                    uuids = set()
+                    unified = []
+                    for player in self._list:
+                        if player.raw_uuid in uuids:
+                            self._unindex(player)
+                            continue
+                        uuids.add(player.raw_uuid)
+                        unified.append(player)
+                    self._list = unified
+                case _:
+                    return False
+            return True
+
         def set(self, index: int, value):
-            self._list[index].name = value
-            self._list[index].last_updated = time.time()
-            BOT.db.save()
+            BOT.db.commit({
+                "op"          : "set",
+                "uuid"        : self._list[index].uuid,
+                "name"        : value,
+                "last_updated": time.time(),
+            })
+
+        def rename(self, uuid: str, name: str):
+            BOT.db.commit({
+                "op"          : "set",
+                "uuid"        : uuid,
+                "name"        : name,
+                "last_updated": time.time(),
+            })
 
         def update(self, uuid: str, discord_id: int, clan_id: int, role_id: int):
-            for index, player in enumerate(self._list):
-                if player.uuid == uuid:
-                    self._list[index].discord = discord_id
-                    self._list[index].clans.list.append(self.Player.Clans.Clan({
-                        "clan"   : clan_id,
-                        "primary": False,
-                        "role"   : role_id,
-                    }))
-            BOT.db.save()
+            BOT.db.commit({
+                "op"     : "update",
+                "uuid"   : uuid,
+                "discord": discord_id,
+                "clan"   : clan_id,
+                "role"   : role_id,
+            })
 
         def unify(self):
-            uuids = []
-            for index, player in enumerate(self._list):
-                if player.uuid in uuids:
-                    self._list.pop(index)
-                uuids.append(player.uuid)
-            BOT.db.save()
+            BOT.db.commit({"op": "unify"})
 
         def modify_by_uuid(self, uuid: str, clan: int, role: int):
-            for index, entry in enumerate(self._list):
-                if entry.uuid == uuid:
-                    for j, c in enumerate(entry.clans.__list__()):
-                        if c.resolve_clan().id == clan:
-                            self._list[index].clans.list[j].role = role
-                            BOT.db.save()
-                            return
-
-        def find_by_ign(self, ign: str) -> Player | None:
-            ign = ign.lower()
-            for entry in self._list:
-                if entry.name.lower() == ign:
-                    return entry
-            return None
+            BOT.db.commit({"op": "modify", "uuid": uuid, "clan": clan, "role": role})
 
         def delete(self, uuid: str):
-            for index, entry in enumerate(self._list):
-                if entry.uuid == uuid:
-                    self._list.pop(index)
-            BOT.db.save()
+            BOT.db.commit({"op": "delete", "uuid": uuid})
+
+        def find_by_ign(self, ign: str) -> Player | None:
+            return self._first(self._by_ign, ign.lower())
 
         def find_by_uuid(self, uuid: str) -> Player | None:
-            for entry in self._list:
-                if entry.uuid == uuid:
-                    return entry
-            return None
+            return self._by_uuid.get(pack_uuid(uuid))
 
         def find_by_discord(self, index: int) -> Player | None:
-            for entry in self._list:
-                if entry.discord == index:
-                    return entry
-            return None
+            return self._first(self._by_discord, index)
+
+        def parents_of(self, player: Player) -> list[Player]:
+            """
+            Main accounts of an alt, resolved once and cached on the alt.
+            """
+            if player._mains is None:
+                player._mains = [
+                    self._by_uuid[i] for i in player.raw_parents or () if i in self._by_uuid
+                ]
+            return player._mains
+
+        def merged_clans(self, player: Player) -> Player.Clans:
+            """
+            Clans of all of an alt's main accounts, cached until one of them is
+            added, deleted or joins a clan (role changes edit the shared entries).
+            """
+            if player._merged is None:
+                merged = self.Player.Clans([])
+                merged.list = [
+                    clan for main in self.parents_of(player) for clan in main.clans.list
+                ]
+                player._merged = merged
+            return player._merged
 
         def get_alts_by_uuid(self, uuid: str) -> tuple[list[Player], list[Player]]:
             """
             :return: (PUBLIC[], PRIVATE[])
             """
-            result = []
-            for entry in self._list:
-                if entry.parents and uuid in entry.parents:
-                    result.append(entry)
+            result = self._by_parent.get(pack_uuid(uuid), [])
             return (
                 [i for i in result if not i.hidden],
                 [i for i in result if i.hidden],
@@ -291,21 +620,19 @@ class Database:
             _slug,
             clan: dict,
         ):
-            self._list.append(
-                self.Player(
-                    {
-                        "parents": parents,
-                        "uuid": uuid,
-                        "name": name,
-                        "hidden": hidden,
-                        "last_updated": time.time(),
-                        "discord": _discord,
-                        "slug": _slug,
-                        "clans": [clan],
-                    }
-                )
-            )
-            BOT.db.save()
+            BOT.db.commit({
+                "op"    : "add",
+                "player": {
+                    "parents": parents,
+                    "uuid": uuid,
+                    "name": name,
+                    "hidden": hidden,
+                    "last_updated": time.time(),
+                    "discord": _discord,
+                    "slug": _slug,
+                    "clans": [clan],
+                },
+            })
 
         def sort(self):
             def sort_lambda(player):
@@ -321,20 +648,233 @@ class Database:
         self.clans = self.Clans(data.get("clans"))
         self.clan_relations = data.get("clan_relations")
         self.players = self.Players(data.get("players"))
+        self.storage: str = data.get("storage") or "json"
+        self.snapshot: str = data.get("snapshot") or "json"
+        self.save_interval: float = data.get("save_interval") or 30
+        self.refresh_window: float = data.get("refresh_window") or 60
+        self.journal_limit: int = data.get("journal_limit") or 256 * 1024
+        self.revision: int = data.get("revision") or 0
+        self.backup_keep: int = data.get("backup_keep") or 10
+        self.backup_days: int = data.get("backup_days") or 30
+        self.metrics_port: int | None = data.get("metrics_port")
+        self.metrics_file: str | None = data.get("metrics_file")
+        self.write_behind = False
+        self.dirty = False
+        self.batch: list[dict] | None = None
+        # Held from capture() until write() is done, so flushes never overlap
+        self.writing = threading.Lock()
+
+    @classmethod
+    def open(cls, data: dict) -> "Database":
+        """
+        Takes the players from the binary snapshot when it's enabled (or when
+        database.json has no players of its own), from database.json otherwise.
+        """
+        if os.path.exists(__snapshot__) and (
+            data.get("snapshot") == "binary" or "players" not in data
+        ):
+            meta, players = read_snapshot(__snapshot__)
+            return cls({**data, **meta, "players": players})
+        return cls(data)
 
-    def __export__(self):
+    def __config__(self):
         return {
             "token": self.token,
             "home": self.home,
+            "storage": self.storage,
+            "snapshot": self.snapshot,
+            "save_interval": self.save_interval,
+            "refresh_window": self.refresh_window,
+            "journal_limit": self.journal_limit,
+            "revision": self.revision,
+            "backup_keep": self.backup_keep,
+            "backup_days": self.backup_days,
+            "metrics_port": self.metrics_port,
+            "metrics_file": self.metrics_file,
             "perm_level": self.perm_level.__export__(),
             "clans": self.clans.__export__(),
             "clan_relations": self.clan_relations,
-            "players": self.players.__export__(),
         }
 
+    def __export__(self):
+        return {**self.__config__(), "players": self.players.__export__()}
+
     def save(self):
-        with open(__db__, "w") as fp:
-            json.dump(self.__export__(), fp, indent=4)
+        BOT.metrics.count("saves")
+        self.dirty = True
+        if not self.write_behind:
+            self.flush()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        with self.writing:
+            self.write(*self.capture())
+
+    async def flush_async(self):
+        """
+        Same as flush(), but only capture() runs on the event loop, the
+        serialising and writing happen in a worker thread.
+        """
+        if not self.dirty or not self.writing.acquire(blocking=False):
+            # Nothing changed, or the last write is still running: next round
+            return
+        try:
+            captured = self.capture()
+        except Exception:
+            self.writing.release()
+            raise
+        # Shielded, so a cancelled autosave still lets the write finish
+        await asyncio.shield(asyncio.to_thread(self._write_locked, *captured))
+
+    def _write_locked(self, snapshot: bytes | None, data: dict):
+        try:
+            self.write(snapshot, data)
+        finally:
+            self.writing.release()
+
+    def capture(self) -> tuple[bytes | None, dict]:
+        """
+        Takes what flush() writes. The journal is moved aside, records
+        committed while it's written go to a fresh one.
+        :return: (BINARY SNAPSHOT OR NONE, DATABASE.JSON DOCUMENT)
+        """
+        BOT.metrics.count("flushes")
+        self.dirty = False
+        snapshot = None
+        if self.snapshot == "binary":
+            snapshot = encode_snapshot({"revision": self.revision}, self.players.__list__())
+            data = self.__config__()
+        else:
+            data = self.__export__()
+        if os.path.exists(__journal__):
+            if os.path.exists(f"{__journal__}.old"):
+                # The last write didn't finish, keep its records as well
+                with open(__journal__, "rb") as src, open(f"{__journal__}.old", "ab") as dst:
+                    dst.write(src.read())
+                os.remove(__journal__)
+            else:
+                os.replace(__journal__, f"{__journal__}.old")
+        return snapshot, data
+
+    @staticmethod
+    def write(snapshot: bytes | None, data: dict):
+        if snapshot is not None:
+            write_snapshot(__snapshot__, snapshot)
+        with open(f"{__db__}.tmp", "w") as fp:
+            json.dump(data, fp, indent=4)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(f"{__db__}.tmp", __db__)
+        if os.path.exists(f"{__journal__}.old"):
+            os.remove(f"{__journal__}.old")
+
+    def restore(self, data: dict):
+        """
+        Replaces clans and players with those of a backup and writes a fresh
+        snapshot right away, so the journal can't replay older records on top.
+        """
+        self.clans = self.Clans(data.get("clans"))
+        self.clan_relations = data.get("clan_relations")
+        self.players = self.Players(data.get("players"))
+        self.revision += 1
+        self.dirty = True
+        self.flush()
+
+    def commit(self, record: dict):
+        """
+        Applies a player mutation and appends it to the journal instead of
+        rewriting the whole database. The journal is folded into a fresh
+        snapshot by flush() once it grows past journal_limit bytes.
+        """
+        if not self.players.apply(record):
+            return
+        BOT.metrics.count("commits")
+        self.revision += 1
+        record = {**record, "rev": self.revision}
+        if self.batch is not None:
+            self.batch.append(record)
+        else:
+            self.append([record])
+
+    def append(self, records: list[dict]):
+        if not records:
+            return
+        BOT.metrics.count("journal_writes")
+        with open(__journal__, "a") as fp:
+            fp.write("".join(json.dumps(record) + "\n" for record in records))
+            size = fp.tell()
+        if size > self.journal_limit:
+            self.save()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Groups every commit() made inside the block into a single journal write.
+        """
+        if self.batch is not None:
+            yield
+            return
+        self.batch = []
+        try:
+            yield
+        finally:
+            records, self.batch = self.batch, None
+            self.append(records)
+
+    def replay(self) -> int:
+        """
+        Re-applies journal records that are newer than the loaded snapshot,
+        including those of a journal moved aside by an unfinished flush.
+        :return: number of replayed records
+        """
+        return sum(
+            self._replay(path)
+            for path in (f"{__journal__}.old", __journal__)
+            if os.path.exists(path)
+        )
+
+    def _replay(self, path: str) -> int:
+        replayed = 0
+        # End of the last complete record
+        offset = 0
+        with open(path, "rb") as fp:
+            for line in fp:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError(line)
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of the journal
+                    break
+                offset += len(line)
+                if record.get("rev", 0) <= self.revision:
+                    continue
+                self.players.apply(record)
+                self.revision = record.get("rev")
+                replayed += 1
+            torn = fp.seek(0, os.SEEK_END) > offset
+        if torn:
+            # Cut the partial line off, or the next append() would be glued to it
+            with open(path, "r+b") as fp:
+                fp.truncate(offset)
+                fp.flush()
+                os.fsync(fp.fileno())
+        return replayed
+
+    async def autosave(self):
+        """
+        Write-behind loop: while it runs, save() only marks the database dirty
+        and the file is rewritten at most once per save_interval.
+        """
+        self.write_behind = True
+        try:
+            while True:
+                await asyncio.sleep(self.save_interval)
+                await self.flush_async()
+        finally:
+            self.write_behind = False
+            self.flush()
 
     def find_clan(self, index: int) -> Clans.Clan | None:
         for clan in self.clans.__list__():
@@ -345,25 +885,113 @@ class Database:
     def get_role(
         self, roles: Clans.Clan.Roles, member: discord.Member
     ) -> Clans.Clan.Roles.Role | None:
-        for role in roles.__list__():
-            if role.discord in [r.id for r in member.roles]:
-                return role
-        return None
+        return roles.resolve({r.id for r in member.roles})
 
 
 class Bot(discord.Bot):
     def __init__(self, *args, **options):
         self.db: None | Database = None
+        # Builds the database in a worker thread when db isn't set yet, see load()
+        self.opener: Callable[[], Database] | None = None
         self.ready_status = False
         self.prefix = "gd:"
         self.path = pathlib.Path(__file__).parent.parent.parent.absolute()
         self.memory: list[discord.TextChannel] = []
+        self.autosave: asyncio.Task | None = None
+        self.web: httpx.AsyncClient | None = None
+        self.profiles: ProfileCache | None = None
+        self.rosters = RosterRecords(os.path.join(self.path, "rosters.json"))
+        self.routes = RouteScheduler()
+        self.refresher = RefreshScheduler(self)
+        self.metrics = Metrics()
+        self.monitors: list[asyncio.Task] = []
 
         super().__init__(*args, **options)
+        self.count_requests()
+
+    def count_requests(self):
+        """
+        Counts every Discord REST call, attributed to the running command.
+        """
+        request = self.http.request
+
+        async def counted(route, *args, **kwargs):
+            self.metrics.count("outbound_requests", "discord")
+            return await request(route, *args, **kwargs)
+
+        self.http.request = counted
 
     def __bool__(self):
         return self.ready_status and self.db is not None
 
+    async def start(self, *args, **kwargs):
+        self.web = self.create_web_client()
+        self.web.event_hooks["request"].append(self.metrics.on_request)
+        self.monitors.append(asyncio.create_task(self.metrics.monitor()))
+        self.profiles = ProfileCache(os.path.join(self.path, "profiles.sqlite"))
+        # The gateway connects while the players are loaded
+        self.monitors.append(asyncio.create_task(self.load()))
+        await super().start(*args, **kwargs)
+
+    async def load(self):
+        """
+        Builds the database with `opener` off the event loop, then starts the
+        tasks that need it. Until then `bool(BOT)` is False and commands are
+        answered with not_ready().
+        """
+        if self.db is None:
+            self.db = await asyncio.to_thread(self.opener)
+        self.autosave = asyncio.create_task(self.db.autosave())
+        if self.db.metrics_port:
+            self.monitors.append(
+                asyncio.create_task(self.metrics.serve(self.db.metrics_port))
+            )
+        if self.db.metrics_file:
+            self.monitors.append(
+                asyncio.create_task(
+                    self.metrics.write(os.path.join(self.path, self.db.metrics_file))
+                )
+            )
+
+    async def close(self):
+        if self.autosave:
+            self.autosave.cancel()
+            self.autosave = None
+        for task in self.monitors:
+            task.cancel()
+        self.monitors = []
+        if self.web:
+            await self.web.aclose()
+            self.web = None
+        if self.profiles:
+            self.profiles.close()
+            self.profiles = None
+        if self.db is not None:
+            self.db.flush()
+        await super().close()
+
+    @staticmethod
+    def create_web_client() -> httpx.AsyncClient:
+        """
+        Shared client for Mojang & co. so connections are kept alive between commands.
+        """
+        try:
+            import h2  # noqa: F401
+
+            http2 = True
+        except ImportError:
+            http2 = False
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=60.0,
+            ),
+            headers={"User-Agent": "gideon-bot"},
+        )
+
     async def not_ready(self, message: discord.Message):
         await message.add_reaction("🚫")
         return self
@@ -1,37 +1,58 @@
-import json
+import asyncio
 import os
 import random
 import time
+from dataclasses import dataclass
 from datetime import datetime
 
 import discord
 import traceback
 
-import httpx
-
-from bot.__utils__ import get_icon, get_name, print_roster, strip_name
+from bot.backup import BackupStore
+from bot.bot import Database
+from bot.__utils__ import chunk_lines, get_icon, get_name, strip_name
+from bot.export import COMPRESSIONS, write_atomic, write_backup, write_members, zstd_available
+from bot.mojang import Profile, RateLimited, UpdateEngine
+from bot.roster import guild_roster_channel, home_roster_channel, refresh_roster
+from bot.sync import IGNORED_MEMBERS, sync_guild
 from src.main import BOT
 
+# Most link-commands gd:gen generates per run
+GEN_LIMIT = 64
+
+
+@dataclass
+class LinkRequest:
+    member: discord.User | discord.Member
+    ign: str
+    clan: Database.Clans.Clan
+    role: Database.Clans.Clan.Roles.Role
+    main: str | None
+    hidden: bool
+
 
 class Command:
     def __init__(self, message: discord.Message, args: list[str]):
         self.message = message
         self.args = args
 
+    def __build__(self, *messages: str) -> discord.Embed:
+        return discord.Embed(
+            description="\n".join(messages)[:4094],
+            color=discord.Color.from_rgb(254, 63, 63),
+        ).set_footer(
+            text=f"Requested by @{get_name(self.message.author)}",
+            icon_url=get_icon(self.message.author),
+        )
+
     async def __reply__(self, *messages: str):
-        await self.message.reply(
-            embed=discord.Embed(
-                description="\n".join(messages)[:4094],
-                color=discord.Color.from_rgb(254, 63, 63),
-            ).set_footer(
-                text=f"Requested by @{get_name(self.message.author)}",
-                icon_url=get_icon(self.message.author),
-            ),
+        return await self.message.reply(
+            embed=self.__build__(*messages),
             mention_author=False,
         )
 
     async def __embed__(self, embed: discord.Embed):
-        await self.message.reply(
+        return await self.message.reply(
             embed=embed.set_footer(
                 text=f"Requested by @{get_name(self.message.author)}",
                 icon_url=get_icon(self.message.author),
@@ -55,8 +76,12 @@ class Command:
         await self.message.add_reaction("🙈")
 
     async def run(self, cmd: str):
+        with BOT.metrics.command(cmd if hasattr(self, f"command_{cmd}") else "unknown"):
+            await self.guard(getattr(self, f"command_{cmd}", self.error)())
+
+    async def guard(self, coro):
         try:
-            await getattr(self, f"command_{cmd}", self.error)()
+            await coro
         except Exception as e:
             traceback.print_exc()
             return await self.__reply__(
@@ -76,19 +101,22 @@ class Command:
             f"- :small_blue_diamond: `{BOT.prefix}help` — Prints this message.",
             f"- :small_blue_diamond: `{BOT.prefix}whois [--reveal]` — Find player's information from their IGN. `["
             f"--reveal]` to show hidden alts (only for root).",
-            f"- :small_blue_diamond: `{BOT.prefix}link <id|slug|mention> <minecraft_ign> <clan_name> <clan_role> [--alt] [<main_ign>] [--hidden]` — Link player.",
+            f"- :small_blue_diamond: `{BOT.prefix}link <id|slug|mention> <minecraft_ign> <clan_name> <clan_role> [--alt] [<main_ign>] [--hidden]` — Link player. Several link lines in one message are linked in bulk.",
             f"- :small_blue_diamond: `{BOT.prefix}unlink <minecraft_ign>` — Unlink player.",
             f"- :small_blue_diamond: `{BOT.prefix}sync [--overwrite]` — Sync database with discord servers. Use --overwrite to replace members' usernames to match Minecraft ones",
             f"- :small_blue_diamond: `{BOT.prefix}refresh` — Sync this server's roster channels with database.",
             f"- :small_blue_diamond: `{BOT.prefix}update` — Update player names from Mojang API.",
-            f"- :small_blue_diamond: `{BOT.prefix}backup` — Create a backup of the database.",
+            f"- :small_blue_diamond: `{BOT.prefix}backup` — Create an incremental backup of the database.",
+            f"- :small_blue_diamond: `{BOT.prefix}restore [<backup>]` — List backups, or restore one.",
+            f"- :small_blue_diamond: `{BOT.prefix}export [gzip|zstd]` — Export the whole database as JSON.",
             f"- :small_blue_diamond: `{BOT.prefix}roles <clan_name>` — Show roles of a clan.",
             f"- :small_blue_diamond: `{BOT.prefix}gen <amount|clan>` — Attempt to generate link-commands for people in the current guild.",
             f"- :small_blue_diamond: `{BOT.prefix}size <clan_name|all>` — Get the size of a clan / all clans.",
             f"- :small_blue_diamond: `{BOT.prefix}ask <anything>` — Ask the bot a question.",
             f"- :small_blue_diamond: `{BOT.prefix}fetch <guild name>` — Fetch all members from a guild name.",
             f"- :small_blue_diamond: `{BOT.prefix}gideon` — Update the home guild.",
-            f"- :small_blue_diamond: `{BOT.prefix}members` — Dump all players into a file.",
+            f"- :small_blue_diamond: `{BOT.prefix}members [gzip|zstd]` — Dump all players into a file.",
+            f"- :small_blue_diamond: `{BOT.prefix}stats` — Command latencies, outbound calls and event-loop lag.",
         )
 
     async def command_whois(self):
@@ -130,7 +158,7 @@ class Command:
                     description="\n".join(
                         [
                             f"## {player.name}",
-                            f"- **Discord**: <@{BOT.db.players.find_by_uuid(auto_player).auto_discord()}> (`{BOT.db.players.find_by_uuid(auto_player).auto_slug()}`)",
+                            f"- **Discord**: <@{auto_player.auto_discord()}> (`{auto_player.auto_slug()}`)",
                             f"- **UUID**: `{player.uuid}`",
                             f"- **Name is up-to-date as of**: <t:{round(player.last_updated)}:R>",
                             f"- **Visit**: [NameMC](https://namemc.com/profile/{player.uuid}), [Laby](https://laby.net/@{player.uuid})",
@@ -164,13 +192,11 @@ class Command:
                 )
                 .set_thumbnail(
                     url=get_icon(
-                        await BOT.fetch_user(
-                            BOT.db.players.find_by_uuid(auto_player).auto_discord()
-                        )
+                        await BOT.fetch_user(auto_player.auto_discord())
                     )
                 )
             )
-            for auto_player in player.parents or [player.uuid]
+            for auto_player in player.resolve_parent() or [player]
         ]
 
     async def command_roles(self):
@@ -186,85 +212,150 @@ class Command:
             + "\n".join([f"{role.icon} {role.name}" for role in clan.roles.__list__()])
         )
 
-    async def command_link(self):
-        if self.require_permission("manager") or len(self.args) < 2:
-            return await self.error()
+    async def parse_link(self, args: list[str]) -> LinkRequest | str:
+        """
+        :return: the parsed gd:link arguments, or an error message
+        """
+        if len(args) < 4:
+            return "Missing arguments!"
 
-        if self.args[0].startswith("<@") and self.args[0].endswith(">"):
-            member = await BOT.fetch_user(int(self.args[0][2:-1]))
-        elif self.args[0].isnumeric():
-            member = await BOT.fetch_user(int(self.args[0]))
+        if args[0].startswith("<@") and args[0].endswith(">"):
+            member = BOT.get_user(int(args[0][2:-1])) or await BOT.fetch_user(int(args[0][2:-1]))
+        elif args[0].isnumeric():
+            member = BOT.get_user(int(args[0])) or await BOT.fetch_user(int(args[0]))
         else:
             member = [
                 member
                 for member in self.message.guild.members
-                if self.args[0].lower() in member.display_name.lower()
+                if args[0].lower() in member.display_name.lower()
             ]
             if not member:
-                return await self.__reply__(
-                    f"Couldn't find such member on this server! Specify their display name, ID or mention them."
-                )
+                return f"Couldn't find such member on this server! Specify their display name, ID or mention them."
             member = member[0]
 
-        main: str | None = None
-        hidden = False
-
-        clan = BOT.db.clans.find(self.args[2].lower())
+        clan = BOT.db.clans.find(args[2].lower())
         if not clan:
-            return await self.__reply__("The specified clan isn't valid!")
+            return "The specified clan isn't valid!"
 
         role = [
             r
             for r in clan.roles.__list__()
-            if r.name.lower() == self.args[3].replace("_", " ").lower()
+            if r.name.lower() == args[3].replace("_", " ").lower()
         ]
         if not role:
-            return await self.__reply__("The specified role isn't valid!")
+            return "The specified role isn't valid!"
+
+        return LinkRequest(
+            member=member,
+            ign=args[1],
+            clan=clan,
+            role=role[0],
+            main=args[5] if len(args) > 5 and args[4] == "--alt" else None,
+            hidden=len(args) > 6 and args[6] == "--hidden",
+        )
 
-        if len(self.args) > 5 and self.args[4] == "--alt":
-            player = BOT.db.players.find_by_ign(self.args[5])
+    @staticmethod
+    def apply_link(request: LinkRequest, profile: Profile) -> str | None:
+        """
+        :return: an error message if the link couldn't be applied
+        """
+        main = None
+        if request.main:
+            player = BOT.db.players.find_by_ign(request.main)
             if not player:
-                return await self.__reply__("The specified alt isn't valid!")
+                return "The specified alt isn't valid!"
             main = player.uuid
 
-        if len(self.args) > 6 and self.args[6] == "--hidden":
-            hidden = True
+        player = BOT.db.players.find_by_uuid(profile.id)
+        if player:
+            BOT.db.players.update(player.uuid, request.member.id if not main else -1, request.clan.id, request.role.id)
+        else:
+            BOT.db.players.add(
+                parents=[main] if main else None,
+                uuid=profile.id,
+                name=profile.name,
+                hidden=request.hidden,
+                _discord=request.member.id if not main else -1,
+                _slug=f"@{get_name(request.member)}" if not main else "",
+                clan={
+                    "clan": request.clan.id,
+                    "primary": True,
+                    "role": request.role.id,
+                },
+            )
+        return None
 
-        async with httpx.AsyncClient(timeout=None) as client:
-            response = await client.get(
-                f"https://api.mojang.com/users/profiles/minecraft/{self.args[1]}"
+    async def command_link(self):
+        if self.require_permission("manager") or len(self.args) < 2:
+            return await self.error()
+
+        request = await self.parse_link(self.args)
+        if isinstance(request, str):
+            return await self.__reply__(request)
+
+        try:
+            profile = await BOT.profiles.by_name(BOT.web, request.ign)
+        except RateLimited:
+            return await self.__reply__(
+                "Try again later. Mojang is rate-limiting the bot!"
             )
 
-            if response.status_code == 200:
-                data = response.json()
-                player = BOT.db.players.find_by_uuid(data.get("id"))
-                if player:
-                    BOT.db.players.update(player.uuid, member.id if not main else -1, clan.id, role[0].id)
-                else:
-                    BOT.db.players.add(
-                        parents=[main] if main else None,
-                        uuid=data.get("id"),
-                        name=data.get("name"),
-                        hidden=hidden,
-                        _discord=member.id if not main else -1,
-                        _slug=f"@{get_name(member)}" if not main else "",
-                        clan={
-                            "clan": clan.id,
-                            "primary": True,
-                            "role": role[0].id,
-                        },
-                    )
-                await self.__reply__(f"Successfully added: `{data.get('name')}`")
-            elif response.status_code == 429:
-                await self.__reply__(
-                    "Try again later. Mojang is rate-limiting the bot!"
-                )
+        if profile:
+            error = self.apply_link(request, profile)
+            if error:
+                return await self.__reply__(error)
+            await self.__reply__(f"Successfully added: `{profile.name}`")
+        else:
+            await self.__reply__(
+                f"Couldn't find such player named `{request.ign}`! ```",
+                f"gd:link {request.member.id} NAME {request.clan.name} {request.role.name.replace(' ', '_')}"
+                f"```",
+            )
+
+    async def bulk_link(self, batch: list[list[str]]):
+        """
+        Several gd:link lines in one message: names are resolved through Mojang's
+        bulk endpoint and every link is saved in one transaction.
+        """
+        if self.require_permission("manager"):
+            return await self.error()
+
+        requests: list[LinkRequest] = []
+        failed = []
+        for args in batch:
+            request = await self.parse_link(args)
+            if isinstance(request, str):
+                failed.append(f"- `{' '.join(args)}`: {request}")
             else:
-                await self.__reply__(
-                    f"Couldn't find such player named `{self.args[1]}`! ```",
-                    f"gd:link {member.id} NAME {clan.name} {role[0].name.replace(' ', '_')}"
-                    f"```",
+                requests.append(request)
+
+        try:
+            profiles = await BOT.profiles.by_names(BOT.web, [r.ign for r in requests])
+        except RateLimited:
+            return await self.__reply__(
+                "Try again later. Mojang is rate-limiting the bot!"
+            )
+
+        added = []
+        with BOT.db.transaction():
+            # Mains first, so alts in the same batch can refer to them
+            for request in sorted(requests, key=lambda r: r.main is not None):
+                profile = profiles.get(request.ign.lower())
+                error = (
+                    f"Couldn't find such player named `{request.ign}`!"
+                    if not profile
+                    else self.apply_link(request, profile)
                 )
+                if error:
+                    failed.append(f"- `{request.ign}`: {error}")
+                else:
+                    added.append(profile.name)
+
+        await self.__reply__(
+            f"### Linked {len(added)}/{len(batch)} players",
+            f"Added: `{', '.join(added) or '---'}`",
+            *failed,
+        )
 
     async def command_unlink(self):
         if self.require_permission("root") or len(self.args) < 1:
@@ -276,33 +367,172 @@ class Command:
         BOT.db.players.delete(player.uuid)
         await self.__reply__("Player was unlinked!")
 
+    def export_compression(self) -> str | None:
+        compression = self.args[0].lower() if self.args else "none"
+        if compression not in COMPRESSIONS or (
+            compression == "zstd" and not zstd_available()
+        ):
+            return None
+        return compression
+
     async def command_backup(self):
         if self.require_permission("root"):
             return await self.error()
 
-        os.makedirs(os.path.join(BOT.path, "backups"), exist_ok=True)
-        name = f"{len(os.listdir(os.path.join(BOT.path, 'backups')))}-backup_{datetime.now().strftime('%d-%B-%Y')}.json"
-        with open(os.path.join(BOT.path, "backups", name), "w") as fp:
-            json.dump(BOT.db.__export__(), fp, indent=4)
+        store = BackupStore(os.path.join(BOT.path, "backups"))
+        # Exported here so the backup is a point-in-time copy, hashing runs off the event loop
+        config = BOT.db.__config__()
+        players = BOT.db.players.__export__()
+        result = await asyncio.to_thread(store.create, config, players)
+        pruned = await asyncio.to_thread(
+            store.prune, BOT.db.backup_keep, BOT.db.backup_days
+        )
         return await self.__reply__(
-            f"Saved backup as: `{name}` ({round(os.path.getsize(os.path.join(BOT.path, 'backups', name)) / 1024, 2)} KB)"
+            f"Saved backup as: `{result.name}` ({result.players} players)",
+            f"{result.written}/{result.chunks} new chunks ({round(result.size / 1024, 2)} KB)"
+            + (f", pruned {pruned} old backups" if pruned else ""),
         )
 
-    async def command_members(self):
+    async def command_restore(self):
         if self.require_permission("root"):
             return await self.error()
 
+        store = BackupStore(os.path.join(BOT.path, "backups"))
+        names = await asyncio.to_thread(store.list)
+        if not self.args:
+            return await self.__reply__(
+                "### Backups",
+                *[f"- `{name}`" for name in reversed(names[-20:])],
+            )
+        if self.args[0] not in names:
+            return await self.error()
+
+        data = await asyncio.to_thread(store.load, self.args[0])
+        BOT.db.restore(data)
+        return await self.__reply__(
+            f"Restored backup `{self.args[0]}` ({len(data.get('players'))} players)"
+        )
+
+    async def command_export(self):
+        compression = self.export_compression()
+        if self.require_permission("root") or not compression:
+            return await self.error()
+
         os.makedirs(os.path.join(BOT.path, "exports"), exist_ok=True)
-        name = f"{len(os.listdir(os.path.join(BOT.path, 'exports')))}-discord_members.md"
-        with open(os.path.join(BOT.path, "exports", name), "w") as fp:
-            for guild in BOT.guilds:
-                fp.writelines([f"# {guild.name} | {guild.id}\n", "| name | id | roles |\n", "| --- | --- | --- |\n"])
-                fp.writelines([f"| {str(member).replace('|', '/')} `{member.display_name.replace('|', '/')}` | {member.id} | {', '.join(['[' + r.name.replace('|', '/') + ' + ' + str(r.id) + ']' for r in member.roles if r.name != '@everyone'])}|\n" for member in guild.members])
-                fp.writelines(["\n\n\n"])
+        name = f"{len(os.listdir(os.path.join(BOT.path, 'exports')))}-database_{datetime.now().strftime('%d-%B-%Y')}.json{COMPRESSIONS[compression]}"
+        # Exported here so the file is a point-in-time copy, serialising runs off the event loop
+        config = BOT.db.__config__()
+        players = BOT.db.players.__export__()
+        size = await asyncio.to_thread(
+            write_atomic,
+            os.path.join(BOT.path, "exports", name),
+            compression,
+            lambda fp: write_backup(fp, config, players),
+        )
         return await self.__reply__(
-            f"Saved export as: `{name}` ({round(os.path.getsize(os.path.join(BOT.path, 'exports', name)) / 1024, 2)} KB)"
+            f"Saved export as: `{name}` ({round(size / 1024, 2)} KB)"
         )
 
+    async def command_members(self):
+        compression = self.export_compression()
+        if self.require_permission("root") or not compression:
+            return await self.error()
+
+        os.makedirs(os.path.join(BOT.path, "exports"), exist_ok=True)
+        name = f"{len(os.listdir(os.path.join(BOT.path, 'exports')))}-discord_members.md{COMPRESSIONS[compression]}"
+        guilds = [(guild.name, guild.id, guild.members) for guild in BOT.guilds]
+        size = await asyncio.to_thread(
+            write_atomic,
+            os.path.join(BOT.path, "exports", name),
+            compression,
+            lambda fp: write_members(fp, guilds),
+        )
+        return await self.__reply__(
+            f"Saved export as: `{name}` ({round(size / 1024, 2)} KB)"
+        )
+
+    async def command_stats(self):
+        if self.require_permission("root"):
+            return await self.error()
+
+        metrics = BOT.metrics
+        calls: dict[str, dict[str, int]] = {}
+        for (name, target, command), value in metrics.counters.items():
+            outbound = calls.setdefault(command, {})
+            outbound[target or name] = outbound.get(target or name, 0) + value
+
+        lines = ["### Gideon: Stats", f"Uptime: {round(time.time() - metrics.started)}s"]
+        for name, histogram in sorted(
+            metrics.commands.items(), key=lambda i: i[1].sum, reverse=True
+        ):
+            outbound = calls.get(name, {})
+            lines.append(
+                f"- `{name}` ×{histogram.count}: p50 {histogram.quantile(0.5):.3f}s, "
+                f"p95 {histogram.quantile(0.95):.3f}s, max {histogram.max:.3f}s"
+                + (
+                    " | " + ", ".join(f"{k} {v}" for k, v in sorted(outbound.items()))
+                    if outbound
+                    else ""
+                )
+            )
+        background = calls.get("-", {})
+        if background:
+            lines.append(
+                "- outside commands: " + ", ".join(f"{k} {v}" for k, v in sorted(background.items()))
+            )
+        lines.append(
+            f"Loop lag: last {metrics.last_lag * 1000:.1f}ms, "
+            f"p95 {metrics.lag.quantile(0.95) * 1000:.1f}ms, max {metrics.lag.max * 1000:.1f}ms"
+        )
+        return await self.__reply__(*lines)
+
+    @staticmethod
+    def gen_candidates(
+        clan: Database.Clans.Clan,
+        members: list[discord.Member],
+        size: int,
+        mention: bool = False,
+        staff: bool = False,
+    ) -> list[str]:
+        """
+        Up to `size` lines for random members that aren't linked yet.
+        """
+        result = []
+        for member in random.sample(members, len(members)):
+            if len(result) >= size:
+                break
+            if member.bot:
+                continue
+            ign = strip_name(member)
+            if (
+                BOT.db.players.find_by_ign(ign) is not None
+                or BOT.db.players.find_by_discord(member.id)
+            ):
+                continue
+            role = BOT.db.get_role(clan.roles, member)
+            if not role and not staff:
+                result.append(f":warning: {member.mention} {', '.join([r.name + '|' + str(r.id) for r in member.roles])}!")
+            elif not role and staff:
+                continue
+            elif role.name == "Offline" or role.name == "Unverified":
+                continue
+            else:
+                if staff and role.id not in clan.roles.staff():
+                    continue
+                if mention:
+                    result.append(
+                        f"{member.id} {member.mention} ({role.icon} {role.name})".replace(
+                            "_", "\\_"
+                        )
+                    )
+                else:
+                    result.append(
+                        f"gd:link {member.id} {ign} {clan.name} {role.name.replace(' ', '_')}".replace(
+                            "_", "\\_"
+                        )
+                    )
+        return result
+
     async def command_gen(self):
         if (
             self.require_permission("root")
@@ -312,10 +542,10 @@ class Command:
 
         if self.args[0].isnumeric():
             guild = None
-            size = min(int(self.args[0]), 32)
+            size = min(int(self.args[0]), GEN_LIMIT)
         else:
             guild = [g for g in BOT.guilds if self.args[0].lower() in g.name.lower()][0]
-            size = 32
+            size = GEN_LIMIT
         if guild:
             clan = BOT.db.find_clan(guild.id)
         else:
@@ -323,53 +553,17 @@ class Command:
         if not clan:
             return await self.__reply__("This guild doesn't belong to any clan!")
 
-        result = []
-        members = []
         mention = len(self.args) > 1 and self.args[1] == "--pretty"
         autosend = len(self.args) > 1 and self.args[1] == "--auto"
         staff = len(self.args) > 1 and self.args[1] == "--staff"
         guild_members = self.message.guild.members if not guild else guild.members
-        guild_members.sort(key=lambda _: random.randint(0, 100_000))
-        for i in range(size):
-            for member in guild_members:
-                ign = strip_name(member)
-                if (
-                    member.bot
-                    or BOT.db.players.find_by_ign(ign) is not None
-                    or member.id in members
-                    or BOT.db.players.find_by_discord(member.id)
-                ):
-                    continue
-                members.append(member.id)
-                role = BOT.db.get_role(clan.roles, member)
-                if not role and not staff:
-                    result.append(f":warning: {member.mention} {', '.join([r.name + '|' + str(r.id) for r in member.roles])}!")
-                elif not role and staff:
-                    continue
-                elif role.name == "Offline" or role.name == "Unverified":
-                    continue
-                else:
-                    print(role.name.lower())
-                    if staff and not [ii for ii in ["leader", "staff", "mod", "helper", "owner", "found", "officer", "recruit"] if ii in role.name.lower()]:
-                        continue
-                    if mention:
-                        result.append(
-                            f"{member.id} {member.mention} ({role.icon} {role.name})".replace(
-                                "_", "\\_"
-                            )
-                        )
-                    else:
-                        result.append(
-                            f"gd:link {member.id} {ign} {clan.name} {role.name.replace(' ', '_')}".replace(
-                                "_", "\\_"
-                            )
-                        )
-                break
+        result = self.gen_candidates(clan, guild_members, size, mention, staff)
         if autosend:
-            return await self.message.channel.send(
-                "\n".join([i.replace("\\", "") for i in result])
-            )
-        await self.__reply__(*result)
+            for content in chunk_lines([i.replace("\\", "") for i in result], 2000):
+                await self.message.channel.send(content)
+            return
+        for content in chunk_lines(result, 4094) or [""]:
+            await self.__reply__(content)
 
     async def command_size(self):
         if self.require_permission("anyone") or len(self.args) < 1:
@@ -393,7 +587,11 @@ class Command:
 
         if self.args[0].lower() == "all":
             return await self.__reply__(
-                f"Global number of registered players: {len(BOT.db.players.__list__())}/{sum([g.member_count for g in BOT.guilds])}",
+                f"Global number of registered players: {len(BOT.db.players)}/{sum([g.member_count for g in BOT.guilds])}",
+                *[
+                    f"- **{clan.name}**: {BOT.db.players.count_by_clan(clan.id)}"
+                    for clan in BOT.db.clans.__list__()
+                ],
                 *leak,
             )
 
@@ -401,8 +599,16 @@ class Command:
         if not clan:
             return await self.__reply__("Couldn't find such clan!")
 
+        size = BOT.db.players.breakdown(clan.id)
         await self.__reply__(
-            f"{clan.name}'s number of registered players: {len([i for i in BOT.db.players.__list__() if clan.id in [j.resolve_clan().id for j in i.clans.__list__()]])}/{BOT.get_guild(clan.guild).member_count}"
+            f"{clan.name}'s number of registered players: {size.players}/{BOT.get_guild(clan.guild).member_count}",
+            f"- **Mains**: {size.mains}, **Alts**: {size.alts}",
+            f"- **Primary**: {size.primary}, **Secondary**: {size.secondary}",
+            *[
+                f"- {role.icon} {role.name}: {size.roles[role.id]}"
+                for role in clan.roles.__list__()
+                if size.roles.get(role.id)
+            ],
         )
 
     # DISABLED:
@@ -420,40 +626,15 @@ class Command:
             return await self.error()
 
         await self.message.add_reaction("☑️")
-        updated_count = 0
-        BOT.db.players.sort()
-
-        while updated_count < len(BOT.db.players.__list__()):
-            async with httpx.AsyncClient(timeout=None) as client:
-                BOT.db.players.sort()
-                try:
-                    print(
-                        f"--> https://api.mojang.com/user/profile/{BOT.db.players.__list__()[0].uuid}"
-                    )
-                    response = await client.get(
-                        f"https://api.mojang.com/user/profile/{BOT.db.players.__list__()[0].uuid}"
-                    )
-                    if response.status_code == 200:
-                        BOT.db.players.set(0, response.json().get("name"))
-                        updated_count += 1
-                        BOT.db.save()
-                    else:
-                        return await self.__reply__(
-                            f"### Exit on {response.status_code}!",
-                            f"> Updated {updated_count}/{len(BOT.db.players.__list__())} players.",
-                            f"> Least up-to-date account is <t:{round(BOT.db.players.__list__()[0].last_updated)}:R>.",
-                        )
-                except httpx.ConnectTimeout:
-                    BOT.db.players.sort()
-                    return await self.__reply__(
-                        f"### Exit on CONNECTION_TIMEOUT!",
-                        f"> Updated {updated_count}/{len(BOT.db.players.__list__())} players.",
-                        f"> Least up-to-date account is <t:{round(BOT.db.players.__list__()[0].last_updated)}:R>.",
-                        f"> Most up-to-date account is <t:{round(BOT.db.players.__list__()[-1].last_updated)}:R>.",
-                    )
+        result = await UpdateEngine(BOT.web, cache=BOT.profiles).run(BOT.db.players)
         BOT.db.players.sort()
+        players = BOT.db.players.__list__()
         await self.__reply__(
-            f"Updated all players. Latest update is <t:{round(BOT.db.players.__list__()[0].last_updated)}:R>"
+            f"### Exit on {result.aborted}!" if result.aborted else "### Updated all players!",
+            f"> Updated {result.updated}/{len(players)} players.",
+            f"> {result.missing} accounts no longer exist, {result.failed} failed.",
+            f"> Least up-to-date account is <t:{round(players[0].last_updated)}:R>.",
+            f"> Most up-to-date account is <t:{round(players[-1].last_updated)}:R>.",
         )
 
     async def command_fetch(self):
@@ -492,22 +673,16 @@ class Command:
             return await self.__reply__("This guild doesn't belong to any clan!")
 
         overwritten = 0
-        failed = []
         overwrite = len(self.args) > 0 and self.args[0] == "--overwrite"
-        for member in self.message.guild.members:
-            if member.id == 465886354941673473 or member.bot:
-                continue
-
-            player = BOT.db.players.find_by_discord(member.id)
-            role = BOT.db.get_role(clan.roles, member)
-
-            if player:
-                if role:
-                    BOT.db.players.modify_by_uuid(player.uuid, clan.id, role.id)
-                else:
-                    failed.append(member.mention)
+        diffs = sync_guild(BOT.db, clan, self.message.guild)
+        failed = [diff.member.mention for diff in diffs if not diff.after]
+        changed = [str(diff) for diff in diffs if diff.after]
+        if overwrite:
+            for member in self.message.guild.members:
+                if member.id in IGNORED_MEMBERS or member.bot:
+                    continue
 
-            if overwrite:
+                player = BOT.db.players.find_by_discord(member.id)
                 if not player or player.name in member.display_name:
                     continue
 
@@ -520,9 +695,16 @@ class Command:
                     await member.edit(nick=f"{__split[0]}{player.name}{__split[1]}")
                 except discord.errors.Forbidden:
                     await self.__reply__(f"Error, can't rename {player.name} ({member.display_name})")
-        await self.__reply__(
-            f"Synced the database! {overwritten} named overwritten.\nFailed: {', '.join(failed)}"
-        )
+        # Failures go first so a long diff can't push them out of the reply
+        for content in chunk_lines(
+            [
+                f"Synced the database! {len(changed)} roles changed, {overwritten} named overwritten.",
+                f"Failed: {', '.join(failed)}",
+                *changed,
+            ],
+            4094,
+        ):
+            await self.__reply__(content)
 
     async def command_refresh(self):
         if self.require_permission("manager"):
@@ -533,67 +715,8 @@ class Command:
         if not clan:
             return await self.__reply__("This guild doesn't belong to any clan!")
 
-        roster_channels = [c for c in self.message.guild.text_channels if "roster" in c.name.lower()]
-        if not roster_channels:
-            channel = await self.message.guild.create_text_channel(name=f"🔥-roster", overwrites={
-                self.message.guild.default_role: discord.PermissionOverwrite(
-                    send_messages=False,
-                    add_reactions=False,
-                    view_channel=True,
-                    read_messages=True,
-                    read_message_history=True,
-                ),
-                BOT.user: discord.PermissionOverwrite(
-                    send_messages=True,
-                    embed_links=True,
-                    attach_files=True,
-                    manage_messages=True,
-                    manage_threads=True,
-                    send_messages_in_threads=True,
-                    view_channel=True,
-                    read_messages=True,
-                    read_message_history=True,
-                ),
-            })
-        elif len(roster_channels) > 1:
-            channel = roster_channels[0]
-            for c in roster_channels:
-                if "clan" in c.name:
-                    channel = c
-                    break
-        else:
-            channel = roster_channels[0]
-
-        BOT.db.players.sort()
-        messages = await print_roster(
-            BOT.db.players.__list__()[0].last_updated,
-            BOT.db.clan_relations,
-            clan.id,
-            clan,
-            channel,
-            BOT.db.clans,
-            [
-                i
-                for i in BOT.db.players.__list__()
-                if clan.id in [j.resolve_clan().id for j in i.clans.__list__()]
-            ],
-            BOT
-        )
-        history = (
-            await channel.history(limit=100, oldest_first=True)
-            .filter(lambda m: m.author.id == BOT.user.id)
-            .flatten()
-        )
-        i = 0
-        for message in history:
-            if i >= len(messages):
-                break
-            await message.edit(content=messages[i])
-            i += 1
-        for message in messages[i:]:
-            await channel.send(content=message)
-            i += 1
-        [await m.delete() for m in history[i:]]
+        channel = await guild_roster_channel(self.message.guild, BOT.user)
+        await refresh_roster(BOT, clan, clan.id, channel)
         await self.__reply__(f"Updated {clan.name}!")
 
     async def command_gideon(self):
@@ -604,66 +727,32 @@ class Command:
         if not guild:
             return await self.error()
 
-        for clan_index, clan in enumerate(BOT.db.clans.__list__()):
-            await self.__reply__(f"Updating... {clan.name} ({clan_index + 1})!")
-            if not [c for c in guild.text_channels if clan.name.lower() in c.name.lower()]:
-                channel = await guild.create_text_channel(name=f"⭐-{clan.name.lower()}", overwrites={
-                    guild.default_role: discord.PermissionOverwrite(
-                        send_messages=False,
-                        add_reactions=False,
-                        view_channel=True,
-                        read_messages=True,
-                        read_message_history=True,
-                    ),
-                    BOT.user: discord.PermissionOverwrite(
-                        send_messages=True,
-                        embed_links=True,
-                        attach_files=True,
-                        manage_messages=True,
-                        manage_threads=True,
-                        send_messages_in_threads=True,
-                        view_channel=True,
-                        read_messages=True,
-                        read_message_history=True,
-                    ),
-                })
-            else:
-                channel = [
-                    c for c in guild.text_channels if clan.name.lower() in c.name
-                ][0]
-
-            BOT.db.players.sort()
-            print(f"{clan.name} --> Generating roster...")
-            messages = await print_roster(
-                BOT.db.players.__list__()[0].last_updated,
-                BOT.db.clan_relations,
-                clan_index,
-                clan,
-                channel,
-                BOT.db.clans,
-                [
-                    i
-                    for i in BOT.db.players.__list__()
-                    if clan.id in [j.resolve_clan().id for j in i.clans.__list__()]
-                ],
-                BOT
+        clans = BOT.db.clans.__list__()
+        progress = {clan.id: "⏳ waiting" for clan in clans}
+
+        async def refresh(clan_index: int, clan):
+            try:
+                await BOT.routes.acquire()
+                channel = await home_roster_channel(guild, clan, BOT.user)
+                progress[clan.id] = "🔄 publishing"
+                result = await refresh_roster(BOT, clan, clan_index, channel)
+                progress[clan.id] = (
+                    f"✅ {result.edited} edited, {result.sent} sent, {result.deleted} deleted"
+                )
+            except Exception as e:
+                traceback.print_exc()
+                progress[clan.id] = f"❌ {e}"
+
+        def report(title: str):
+            return self.__build__(
+                title,
+                *[f"- **{clan.name}**: {progress[clan.id]}" for clan in clans],
             )
-            print(f"{clan.name} --> Printing...")
-            history = (
-                await channel.history(limit=100, oldest_first=True)
-                .filter(lambda m: m.author.id == BOT.user.id)
-                .flatten()
+
+        status = await self.__embed__(report("### Updating clans..."))
+        task = asyncio.gather(*[refresh(i, clan) for i, clan in enumerate(clans)])
+        while not task.done():
+            await asyncio.wait([task], timeout=3)
+            await status.edit(
+                embed=report("### Updated all clans!" if task.done() else "### Updating clans...")
             )
-            i = 0
-            for message in history:
-                if i >= len(messages):
-                    break
-                await message.edit(content=messages[i])
-                i += 1
-            for message in messages[i:]:
-                await channel.send(content=message)
-                i += 1
-            if history[i:]:
-                [await m.delete() for m in history[i:]]
-            print(f"{clan.name} --> Continuting...")
-            await self.__reply__(f"Updated {clan.name} ({clan_index+1})!")
@@ -1,3 +1,5 @@
+import asyncio
+import itertools
 import json
 import time
 
@@ -6,6 +8,15 @@ import discord
 from src.main import BOT
 from .__utils__ import get_icon, get_name
 from .commands import Command
+from .sync import sync_member
+
+
+def load_memory() -> list:
+    try:
+        with open("memory.json", "r") as fp:
+            return json.load(fp).get("memory")
+    except FileNotFoundError:
+        return []
 
 
 def filter_memory(message: discord.Message):
@@ -30,8 +41,7 @@ async def on_connect():
 async def on_ready():
     BOT.ready_status = True
     print(f"--> Bot is now ready!")
-    with open("memory.json", "r") as fp:
-        BOT.memory = json.load(fp).get("memory")
+    BOT.memory = await asyncio.to_thread(load_memory)
 
     await BOT.change_presence(activity=discord.Game(name="with its source code"))
     # for guild in BOT.guilds:
@@ -40,13 +50,51 @@ async def on_ready():
     #         print(f"--> {len(role.members)} | {role.id} | {role.name}")
 
 
+@BOT.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if not BOT or (before.roles == after.roles and before.premium_since == after.premium_since):
+        return
+    clan = BOT.db.find_clan(after.guild.id)
+    if not clan:
+        return
+    if before.roles != after.roles:
+        diff = sync_member(BOT.db, clan, after)
+        if diff:
+            print(f"--> {clan.name} {diff}")
+    BOT.refresher.schedule(clan)
+
+
+@BOT.event
+async def on_member_remove(member: discord.Member):
+    if not BOT:
+        return
+    clan = BOT.db.find_clan(member.guild.id)
+    if clan:
+        BOT.refresher.schedule(clan)
+
+
 @BOT.event
 async def on_message(message: discord.Message):
+    commands = []
     for line in message.content.split("\n"):
         if not line.lower().startswith(BOT.prefix) or len(line) == 1:
             continue
         __split = (
             line[3:].replace("  ", " ").replace("  ", " ").replace("  ", " ").split(" ")
         )
-        cmd, args = __split[0], __split[1:]
-        await Command(message, args).run(cmd)
+        commands.append((__split[0], __split[1:]))
+    if commands and not BOT:
+        # Players are still being loaded, see Bot.load()
+        return await BOT.not_ready(message)
+
+    # Runs of consecutive link lines are linked in bulk, in message order
+    # with the other commands
+    for bulk, group in itertools.groupby(commands, key=lambda c: c[0] == "link"):
+        group = list(group)
+        if bulk and len(group) > 1:
+            command = Command(message, [])
+            with BOT.metrics.command("link"):
+                await command.guard(command.bulk_link([args for _, args in group]))
+            continue
+        for cmd, args in group:
+            await Command(message, args).run(cmd)
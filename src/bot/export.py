@@ -0,0 +1,76 @@
+import gzip
+import io
+import json
+import os
+
+# Compression name -> file suffix
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def open_export(path: str, compression: str = "none") -> io.TextIOBase:
+    """
+    Text stream writing `path`, compressed on the fly.
+    """
+    match compression:
+        case "gzip":
+            return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        case "zstd":
+            import zstandard
+
+            return io.TextIOWrapper(
+                zstandard.ZstdCompressor().stream_writer(open(path, "wb")),
+                encoding="utf-8",
+            )
+    return open(path, "w", encoding="utf-8")
+
+
+def write_atomic(path: str, compression: str, write) -> int:
+    """
+    Runs `write(fp)` against a temporary file that replaces `path` once complete.
+    :return: size of the written file in bytes
+    """
+    with open_export(f"{path}.tmp", compression) as fp:
+        write(fp)
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+
+def write_backup(fp: io.TextIOBase, config: dict, players: list[dict]):
+    """
+    Same document as Database.__export__(), serialised one exported player at a time.
+    """
+    fp.write("{\n")
+    for key, value in config.items():
+        fp.write(f"    {json.dumps(key)}: {json.dumps(value)},\n")
+    fp.write('    "players": [')
+    for i, player in enumerate(players):
+        fp.write(",\n        " if i else "\n        ")
+        fp.write(json.dumps(player))
+    fp.write("\n    ]\n}\n")
+
+
+def write_members(fp: io.TextIOBase, guilds: list[tuple[str, int, list]]):
+    """
+    One markdown table of members per (NAME, ID, MEMBERS) guild.
+    """
+    for name, guild_id, members in guilds:
+        fp.write(f"# {name} | {guild_id}\n| name | id | roles |\n| --- | --- | --- |\n")
+        for member in members:
+            roles = ", ".join(
+                f"[{r.name.replace('|', '/')} + {r.id}]"
+                for r in member.roles
+                if r.name != "@everyone"
+            )
+            fp.write(
+                f"| {str(member).replace('|', '/')} `{member.display_name.replace('|', '/')}` "
+                f"| {member.id} | {roles}|\n"
+            )
+        fp.write("\n\n\n")
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import time
+from collections import Counter
+
+# Command the current task is running for, "-" outside of commands
+current_command: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_command", default="-"
+)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, math.inf
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        :return: upper bound of the bucket holding the q-quantile (capped at max)
+        """
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target and seen:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    In-process metrics: command latency histograms, outbound call and save
+    counters (attributed to the command that caused them) and event-loop lag.
+    Rendered in the Prometheus text format, served over HTTP and/or written
+    to a file.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.commands: dict[str, Histogram] = {}
+        # (counter, target, command) -> value
+        self.counters: Counter[tuple[str, str, str]] = Counter()
+        self.lag = Histogram()
+        self.last_lag = 0.0
+
+    def count(self, name: str, target: str = "", amount: int = 1):
+        self.counters[(name, target, current_command.get())] += amount
+
+    @contextlib.contextmanager
+    def command(self, name: str):
+        token = current_command.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.commands.setdefault(name, Histogram()).observe(
+                time.perf_counter() - start
+            )
+            current_command.reset(token)
+
+    async def on_request(self, request):
+        """
+        httpx request hook.
+        """
+        self.count("outbound_requests", request.url.host)
+
+    async def monitor(self, interval: float = 1.0):
+        """
+        Measures how late the event loop wakes up from a sleep of `interval`.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.last_lag = max(0.0, loop.time() - start - interval)
+            self.lag.observe(self.last_lag)
+
+    @staticmethod
+    def _histogram(name: str, labels: str, histogram: Histogram) -> list[str]:
+        lines = []
+        seen = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            seen += count
+            le = "+Inf" if bound == math.inf else f"{bound:g}"
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {seen}')
+        labels = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {histogram.sum}")
+        lines.append(f"{name}_count{labels} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE gideon_command_seconds histogram",
+            *[
+                line
+                for name, histogram in sorted(self.commands.items())
+                for line in self._histogram(
+                    "gideon_command_seconds", f'command="{name}"', histogram
+                )
+            ],
+            "# TYPE gideon_loop_lag_seconds histogram",
+            *self._histogram("gideon_loop_lag_seconds", "", self.lag),
+        ]
+        for counter in sorted({key[0] for key in self.counters}):
+            lines.append(f"# TYPE gideon_{counter}_total counter")
+            for (name, target, command), value in sorted(self.counters.items()):
+                if name == counter:
+                    lines.append(
+                        f'gideon_{name}_total{{target="{target}",command="{command}"}} {value}'
+                    )
+        lines.append("# TYPE gideon_uptime_seconds gauge")
+        lines.append(f"gideon_uptime_seconds {time.time() - self.started}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port: int, host: str = "127.0.0.1"):
+        """
+        Minimal /metrics endpoint for Prometheus to scrape.
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass
+                if request.split(b" ")[1:2] == [b"/metrics"]:
+                    status, body = "200 OK", self.render().encode()
+                else:
+                    status, body = "404 Not Found", b""
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def write(self, path: str, interval: float = 60, keep: int = 5):
+        """
+        Writes the metrics to `path` every `interval` seconds, the previous
+        `keep` files are rotated to `path`.1 .. `path`.N.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            content = self.render()
+            await asyncio.to_thread(self._rotate, path, content, keep)
+
+    @staticmethod
+    def _rotate(path: str, content: str, keep: int):
+        for i in range(keep - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if keep > 0 and os.path.exists(path):
+            os.replace(path, f"{path}.1")
+        with open(f"{path}.tmp", "w") as fp:
+            fp.write(content)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import httpx
+
+from .__utils__ import TokenBucket
+
+PROFILE_URL = "https://api.mojang.com/user/profile/{}"
+NAME_URL = "https://api.mojang.com/users/profiles/minecraft/{}"
+BULK_URL = "https://api.minecraftservices.com/minecraft/profile/lookup/bulk/byname"
+# Most names the bulk endpoint accepts per request
+BULK_SIZE = 10
+# Anything else can't be an account, and makes the bulk endpoint reject the whole request
+VALID_IGN = re.compile(r"^[A-Za-z0-9_]{1,16}$")
+
+
+class RateLimited(Exception):
+    pass
+
+
+@dataclass
+class Profile:
+    id: str
+    name: str
+
+
+class ProfileCache:
+    """
+    IGN -> UUID and UUID -> name answers from Mojang. Recently used entries are
+    kept in an in-memory LRU, everything is also stored on disk so it survives
+    restarts. Negative (404) answers expire sooner than positive ones since the
+    name may get claimed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 4096,
+        ttl: float = 24 * 3600,
+        negative_ttl: float = 600,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: OrderedDict[str, tuple[float, Profile | None]] = OrderedDict()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles "
+            "(key TEXT PRIMARY KEY, uuid TEXT, name TEXT, expires REAL NOT NULL)"
+        )
+        self.conn.execute("DELETE FROM profiles WHERE expires < ?", (time.time(),))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _remember(self, key: str, expires: float, profile: Profile | None):
+        self.entries[key] = (expires, profile)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> tuple[bool, Profile | None]:
+        """
+        :return: (HIT, PROFILE) where PROFILE is None for a cached 404
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            row = self.conn.execute(
+                "SELECT expires, uuid, name FROM profiles WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            entry = (row[0], Profile(row[1], row[2]) if row[1] else None)
+        if entry[0] < time.time():
+            self.entries.pop(key, None)
+            self.conn.execute("DELETE FROM profiles WHERE key = ?", (key,))
+            self.conn.commit()
+            return False, None
+        self._remember(key, *entry)
+        return True, entry[1]
+
+    def store(self, key: str, profile: Profile | None):
+        expires = time.time() + (self.ttl if profile else self.negative_ttl)
+        keys = [key]
+        if profile:
+            keys = list({key, f"name:{profile.name.lower()}", f"uuid:{profile.id}"})
+        for i in keys:
+            self._remember(i, expires, profile)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO profiles (key, uuid, name, expires) VALUES (?, ?, ?, ?)",
+            [
+                (i, profile.id if profile else None, profile.name if profile else None, expires)
+                for i in keys
+            ],
+        )
+        self.conn.commit()
+
+    async def by_name(self, client: httpx.AsyncClient, ign: str) -> Profile | None:
+        key = f"name:{ign.lower()}"
+        hit, profile = self.get(key)
+        if hit:
+            return profile
+
+        response = await client.get(NAME_URL.format(ign))
+        match response.status_code:
+            case 200:
+                data = response.json()
+                profile = Profile(data.get("id"), data.get("name"))
+            case 204 | 404:
+                profile = None
+            case 429:
+                raise RateLimited()
+            case _:
+                return None
+        self.store(key, profile)
+        return profile
+
+    async def by_names(
+        self, client: httpx.AsyncClient, igns: list[str]
+    ) -> dict[str, Profile | None]:
+        """
+        :return: lowercased IGN -> profile, None for names that don't exist
+        """
+        result: dict[str, Profile | None] = {}
+        missing = []
+        for ign in dict.fromkeys(i.lower() for i in igns):
+            hit, profile = self.get(f"name:{ign}")
+            if hit:
+                result[ign] = profile
+            elif not VALID_IGN.match(ign):
+                result[ign] = None
+            else:
+                missing.append(ign)
+
+        for i in range(0, len(missing), BULK_SIZE):
+            chunk = missing[i : i + BULK_SIZE]
+            response = await client.post(BULK_URL, json=chunk)
+            if response.status_code == 429:
+                raise RateLimited()
+            if response.status_code != 200:
+                # Don't fail the whole chunk for one name, ask for each one instead
+                for ign in chunk:
+                    result[ign] = await self.by_name(client, ign)
+                continue
+            found = {
+                entry.get("name").lower(): Profile(entry.get("id"), entry.get("name"))
+                for entry in response.json()
+            }
+            for ign in chunk:
+                result[ign] = found.get(ign)
+                self.store(f"name:{ign}", result[ign])
+        return result
+
+
+@dataclass
+class UpdateResult:
+    updated: int = 0
+    missing: int = 0
+    failed: int = 0
+    aborted: str | None = None
+
+
+class UpdateEngine:
+    """
+    Refreshes player names from the Mojang API, least up-to-date accounts first.
+    Requests are spread over `workers` concurrent tasks and throttled by a token
+    bucket that defaults to Mojang's limit of 600 requests per 10 minutes.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        workers: int = 8,
+        bucket: TokenBucket | None = None,
+        retries: int = 5,
+        max_timeouts: int = 10,
+        cache: ProfileCache | None = None,
+    ):
+        self.client = client
+        self.cache = cache
+        self.workers = workers
+        self.bucket = bucket or TokenBucket(rate=1.0, capacity=60)
+        self.retries = retries
+        self.max_timeouts = max_timeouts
+        self.result = UpdateResult()
+        # Consecutive transport errors (timeouts, refused or dropped connections)
+        self.timeouts = 0
+        self.heap: list[tuple[float, str]] = []
+
+    async def run(self, players) -> UpdateResult:
+        self.heap = [(player.last_updated, player.uuid) for player in players.__list__()]
+        heapq.heapify(self.heap)
+        tasks = [asyncio.create_task(self.worker(players)) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Don't leave the other workers running if one of them failed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.result
+
+    async def worker(self, players):
+        while self.heap and not self.result.aborted:
+            _, uuid = heapq.heappop(self.heap)
+            name = await self.fetch(uuid)
+            if name:
+                players.rename(uuid, name)
+                self.result.updated += 1
+
+    async def fetch(self, uuid: str) -> str | None:
+        # Never answered from the cache: rename() stamps the player as up to date.
+        # Answers are still stored for gd:link
+        for attempt in range(self.retries):
+            await self.bucket.acquire()
+            if self.result.aborted:
+                return None
+            try:
+                response = await self.client.get(PROFILE_URL.format(uuid))
+            except httpx.TransportError:
+                self.timeouts += 1
+                if self.timeouts >= self.max_timeouts:
+                    self.result.aborted = "CONNECTION_TIMEOUT"
+                    return None
+                await asyncio.sleep(min(2**attempt, 60))
+                continue
+
+            self.timeouts = 0
+            match response.status_code:
+                case 200:
+                    name = response.json().get("name")
+                    if self.cache:
+                        self.cache.store(f"uuid:{uuid}", Profile(uuid, name))
+                    return name
+                case 204 | 404:
+                    if self.cache:
+                        self.cache.store(f"uuid:{uuid}", None)
+                    self.result.missing += 1
+                    return None
+                case 429:
+                    retry_after = response.headers.get("Retry-After")
+                    self.bucket.pause(
+                        float(retry_after) if retry_after else min(2 ** (attempt + 2), 120)
+                    )
+                case _:
+                    await asyncio.sleep(min(2**attempt, 60))
+        self.result.failed += 1
+        return None
@@ -0,0 +1,324 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import traceback
+from dataclasses import dataclass
+
+import discord
+
+from .__utils__ import TokenBucket, print_roster
+
+
+def digest(content: str) -> str:
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class RosterRecords:
+    """
+    Remembers which messages the bot last published to each roster channel
+    (channel id -> {"messages": [[message id, content sha1], ...], "latest": id})
+    so a refresh doesn't need to read the channel history or edit messages
+    that didn't change. `latest` is the newest message the bot ever published
+    there, deleted ones included, to tell whether anything was posted since.
+    A record is checked against the channel history again once it is older
+    than `verify_after` seconds (and after every restart).
+    """
+
+    def __init__(self, path: str, verify_after: float = 3600):
+        self.path = path
+        self.verify_after = verify_after
+        self.channels: dict[int, list[tuple[int, str]]] = {}
+        self.latest: dict[int, int] = {}
+        # channel id -> when its record was last read from the history
+        self.verified: dict[int, float] = {}
+        # One publish per channel at a time, see publish_roster()
+        self.locks: dict[int, asyncio.Lock] = {}
+        if os.path.exists(path):
+            with open(path, "r") as fp:
+                for channel, record in json.load(fp).items():
+                    if isinstance(record, list):
+                        # Written before `latest` was kept
+                        record = {"messages": record}
+                    entries = [(entry[0], entry[1]) for entry in record.get("messages")]
+                    self.channels[int(channel)] = entries
+                    self.latest[int(channel)] = max(
+                        [record.get("latest") or 0, *(entry[0] for entry in entries)]
+                    )
+
+    def lock(self, channel: int) -> asyncio.Lock:
+        lock = self.locks.get(channel)
+        if lock is None:
+            lock = self.locks[channel] = asyncio.Lock()
+        return lock
+
+    def get(self, channel: int) -> list[tuple[int, str]] | None:
+        if time.time() - self.verified.get(channel, 0) > self.verify_after:
+            return None
+        return self.channels.get(channel)
+
+    def verify(self, channel: int):
+        self.verified[channel] = time.time()
+
+    def set(self, channel: int, entries: list[tuple[int, str]]):
+        self.channels[channel] = entries
+        self.latest[channel] = max(
+            [self.latest.get(channel, 0), *(entry[0] for entry in entries)]
+        )
+        self.save()
+
+    def stale(self, channel: int, last_message_id: int | None) -> bool:
+        """
+        :return: whether a message newer than any of ours was posted to the channel
+        """
+        return last_message_id is not None and last_message_id > self.latest.get(channel, 0)
+
+    def discard(self, channel: int):
+        self.verified.pop(channel, None)
+        if self.channels.pop(channel, None) is not None:
+            self.save()
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w") as fp:
+            json.dump(
+                {
+                    str(channel): {
+                        "messages": self.channels.get(channel, []),
+                        "latest": latest,
+                    }
+                    for channel, latest in self.latest.items()
+                },
+                fp,
+            )
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class RouteScheduler:
+    """
+    Client-side throttle mirroring Discord's rate-limit buckets: one global
+    bucket and one bucket per channel, so concurrent roster refreshes don't
+    run into 429s.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 50,
+        channel_rate: float = 1,
+        channel_burst: int = 5,
+    ):
+        self.global_bucket = TokenBucket(global_rate, int(global_rate))
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.channels: dict[int, TokenBucket] = {}
+
+    async def acquire(self, channel: int | None = None):
+        if channel is not None:
+            bucket = self.channels.get(channel)
+            if bucket is None:
+                bucket = self.channels[channel] = TokenBucket(
+                    self.channel_rate, self.channel_burst
+                )
+            await bucket.acquire()
+        await self.global_bucket.acquire()
+
+
+@dataclass
+class PublishResult:
+    edited: int = 0
+    sent: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+
+async def publish_roster(
+    channel: discord.TextChannel,
+    messages: list[str],
+    records: RosterRecords,
+    author: int,
+    scheduler: RouteScheduler | None = None,
+    retry: bool = True,
+) -> PublishResult:
+    """
+    Makes the bot's messages in `channel` match `messages`: only changed
+    messages are edited, extra ones are sent or deleted at the tail.
+    Publishes to the same channel (debounced refreshes, gd:refresh,
+    gd:gideon) run one after the other.
+    """
+    async with records.lock(channel.id):
+        return await _publish_roster(channel, messages, records, author, scheduler, retry)
+
+
+async def _publish_roster(
+    channel: discord.TextChannel,
+    messages: list[str],
+    records: RosterRecords,
+    author: int,
+    scheduler: RouteScheduler | None,
+    retry: bool,
+) -> PublishResult:
+    async def route():
+        if scheduler:
+            await scheduler.acquire(channel.id)
+
+    record = records.get(channel.id)
+    if record is not None and records.stale(channel.id, channel.last_message_id):
+        # Roster channels are read-only, a newer message means ours were
+        # deleted or moved by hand
+        records.discard(channel.id)
+        record = None
+    if record is None:
+        await route()
+        history = (
+            await channel.history(limit=100, oldest_first=True)
+            .filter(lambda m: m.author.id == author)
+            .flatten()
+        )
+        record = [(m.id, digest(m.content)) for m in history]
+        records.verify(channel.id)
+
+    result = PublishResult()
+    published = []
+    try:
+        for i, content in enumerate(messages):
+            checksum = digest(content)
+            if i < len(record):
+                message_id, previous = record[i]
+                if previous == checksum:
+                    result.unchanged += 1
+                else:
+                    await route()
+                    await channel.get_partial_message(message_id).edit(content=content)
+                    result.edited += 1
+                published.append((message_id, checksum))
+            else:
+                await route()
+                message = await channel.send(content=content)
+                published.append((message.id, checksum))
+                result.sent += 1
+        for message_id, _ in record[len(messages):]:
+            await route()
+            await channel.get_partial_message(message_id).delete()
+            result.deleted += 1
+    except discord.NotFound:
+        # Somebody removed a roster message by hand, the record is stale
+        records.discard(channel.id)
+        if not retry:
+            raise
+        return await _publish_roster(
+            channel, messages, records, author, scheduler, retry=False
+        )
+
+    records.set(channel.id, published)
+    return result
+
+
+def roster_overwrites(guild: discord.Guild, user: discord.ClientUser):
+    return {
+        guild.default_role: discord.PermissionOverwrite(
+            send_messages=False,
+            add_reactions=False,
+            view_channel=True,
+            read_messages=True,
+            read_message_history=True,
+        ),
+        user: discord.PermissionOverwrite(
+            send_messages=True,
+            embed_links=True,
+            attach_files=True,
+            manage_messages=True,
+            manage_threads=True,
+            send_messages_in_threads=True,
+            view_channel=True,
+            read_messages=True,
+            read_message_history=True,
+        ),
+    }
+
+
+async def guild_roster_channel(
+    guild: discord.Guild, user: discord.ClientUser, create: bool = True
+):
+    """
+    Roster channel of a clan's own guild, created if missing.
+    """
+    roster_channels = [c for c in guild.text_channels if "roster" in c.name.lower()]
+    if not roster_channels:
+        if not create:
+            return None
+        return await guild.create_text_channel(
+            name=f"🔥-roster", overwrites=roster_overwrites(guild, user)
+        )
+    for c in roster_channels:
+        if "clan" in c.name:
+            return c
+    return roster_channels[0]
+
+
+async def home_roster_channel(
+    guild: discord.Guild, clan, user: discord.ClientUser, create: bool = True
+):
+    """
+    Channel of `clan` in the home guild, created if missing.
+    """
+    for c in guild.text_channels:
+        if clan.name.lower() in c.name.lower():
+            return c
+    if not create:
+        return None
+    return await guild.create_text_channel(
+        name=f"⭐-{clan.name.lower()}", overwrites=roster_overwrites(guild, user)
+    )
+
+
+async def refresh_roster(
+    BOT, clan, index: int, channel: discord.TextChannel
+) -> PublishResult:
+    messages = await print_roster(
+        min((i.last_updated for i in BOT.db.players.__list__()), default=time.time()),
+        BOT.db.clan_relations,
+        index,
+        clan,
+        channel,
+        BOT.db.clans,
+        BOT.db.players.in_clan(clan.id),
+        BOT,
+    )
+    return await publish_roster(
+        channel, messages, BOT.rosters, BOT.user.id, BOT.routes
+    )
+
+
+class RefreshScheduler:
+    """
+    Debounces automatic roster refreshes: the first member event of a clan
+    opens a `refresh_window` second window, further events inside it are
+    coalesced, and the clan's rosters are re-published once it closes.
+    Only channels that already exist are refreshed.
+    """
+
+    def __init__(self, BOT):
+        self.BOT = BOT
+        self.pending: dict[int, asyncio.Task] = {}
+
+    def schedule(self, clan):
+        if clan.id in self.pending:
+            return
+        self.pending[clan.id] = asyncio.create_task(self.run(clan))
+
+    async def run(self, clan):
+        await asyncio.sleep(self.BOT.db.refresh_window)
+        self.pending.pop(clan.id, None)
+        try:
+            guild = self.BOT.get_guild(clan.guild)
+            channel = guild and await guild_roster_channel(guild, self.BOT.user, create=False)
+            if channel:
+                await refresh_roster(self.BOT, clan, clan.id, channel)
+
+            home = self.BOT.get_guild(self.BOT.db.home)
+            channel = home and await home_roster_channel(home, clan, self.BOT.user, create=False)
+            if channel:
+                index = self.BOT.db.clans.__list__().index(clan)
+                await refresh_roster(self.BOT, clan, index, channel)
+        except Exception:
+            traceback.print_exc()
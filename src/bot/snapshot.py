@@ -0,0 +1,175 @@
+"""
+Binary player snapshot, used instead of rewriting database.json when
+`"snapshot": "binary"` is set. Layout (little-endian):
+
+    header   magic, version, meta crc32, players crc32, player count, meta length
+    meta     JSON object (revision)
+    players  one record per player, see RECORD
+
+Both checksums are verified and the players decoded when the snapshot is
+read, so a corrupted file fails at startup. Bot.load() reads it in a worker
+thread while the gateway connects, so the event loop isn't held up by it.
+"""
+
+import json
+import os
+import struct
+import zlib
+
+MAGIC = b"GDSNAP"
+VERSION = 1
+HEADER = struct.Struct("<6sHIIII")
+# last_updated, discord, flags, parent count, clan count
+RECORD = struct.Struct("<dqBBB")
+CLAN = struct.Struct("<qBq")
+NAME = struct.Struct("<H")
+ID = struct.Struct("<BB")
+
+HIDDEN = 1
+NO_DISCORD = 2
+NO_SLUG = 4
+HAS_PARENTS = 8
+# Clan or role id that was None
+MISSING = -(2**63)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _put_id(out: bytearray, value: bytes | str):
+    raw = value if isinstance(value, bytes) else (value or "").encode()
+    out += ID.pack(isinstance(value, bytes), len(raw))
+    out += raw
+
+
+def _put_str(out: bytearray, value: str | None):
+    raw = (value or "").encode()
+    out += NAME.pack(len(raw))
+    out += raw
+
+
+def encode_snapshot(meta: dict, players: list) -> bytes:
+    body = bytearray()
+    for player in players:
+        flags = (
+            (HIDDEN if player.hidden else 0)
+            | (NO_DISCORD if player.discord is None else 0)
+            | (NO_SLUG if player.slug is None else 0)
+            | (HAS_PARENTS if player.raw_parents is not None else 0)
+        )
+        clans = player.clans.__list__()
+        body += RECORD.pack(
+            player.last_updated,
+            player.discord or 0,
+            flags,
+            len(player.raw_parents or ()),
+            len(clans),
+        )
+        _put_id(body, player.raw_uuid)
+        _put_str(body, player.name)
+        _put_str(body, player.slug)
+        for parent in player.raw_parents or ():
+            _put_id(body, parent)
+        for clan in clans:
+            body += CLAN.pack(
+                MISSING if clan.clan is None else clan.clan,
+                bool(clan.primary),
+                MISSING if clan.role is None else clan.role,
+            )
+
+    encoded = json.dumps(meta).encode()
+    return (
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            zlib.crc32(encoded),
+            zlib.crc32(body),
+            len(players),
+            len(encoded),
+        )
+        + encoded
+        + body
+    )
+
+
+def write_snapshot(path: str, content: bytes):
+    with open(f"{path}.tmp", "wb") as fp:
+        fp.write(content)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def _get_id(view, offset: int) -> tuple[str, int]:
+    packed, length = ID.unpack_from(view, offset)
+    offset += ID.size
+    raw = bytes(view[offset : offset + length])
+    return (raw.hex() if packed else raw.decode()), offset + length
+
+
+def _get_str(view, offset: int) -> tuple[str, int]:
+    (length,) = NAME.unpack_from(view, offset)
+    offset += NAME.size
+    return str(view[offset : offset + length], "utf-8"), offset + length
+
+
+def read_snapshot(path: str) -> tuple[dict, list[dict]]:
+    """
+    :return: (META, PLAYERS) with PLAYERS in the database.json format
+    """
+    with open(path, "rb") as fp:
+        view = memoryview(fp.read())
+    if len(view) < HEADER.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, version, meta_crc, players_crc, count, meta_length = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"{path} isn't a version {VERSION} snapshot")
+    encoded = view[HEADER.size : HEADER.size + meta_length]
+    if zlib.crc32(encoded) != meta_crc:
+        raise SnapshotError(f"{path} is corrupted (meta checksum)")
+    body = view[HEADER.size + meta_length :]
+    if zlib.crc32(body) != players_crc:
+        raise SnapshotError(f"{path} is corrupted (players checksum)")
+
+    players = []
+    offset = 0
+    try:
+        for _ in range(count):
+            last_updated, discord, flags, parent_count, clan_count = RECORD.unpack_from(
+                body, offset
+            )
+            offset += RECORD.size
+            uuid, offset = _get_id(body, offset)
+            name, offset = _get_str(body, offset)
+            slug, offset = _get_str(body, offset)
+            parents = []
+            for _ in range(parent_count):
+                parent, offset = _get_id(body, offset)
+                parents.append(parent)
+            clans = []
+            for _ in range(clan_count):
+                clan, primary, role = CLAN.unpack_from(body, offset)
+                offset += CLAN.size
+                clans.append(
+                    {
+                        "clan": None if clan == MISSING else clan,
+                        "primary": bool(primary),
+                        "role": None if role == MISSING else role,
+                    }
+                )
+            players.append(
+                {
+                    "parents": parents if flags & HAS_PARENTS else None,
+                    "uuid": uuid,
+                    "name": name,
+                    "hidden": bool(flags & HIDDEN),
+                    "last_updated": last_updated,
+                    "discord": None if flags & NO_DISCORD else discord,
+                    "slug": None if flags & NO_SLUG else slug,
+                    "clans": clans,
+                }
+            )
+    except (struct.error, UnicodeDecodeError) as e:
+        raise SnapshotError(f"{path} is corrupted ({e})")
+    return json.loads(bytes(encoded)), players
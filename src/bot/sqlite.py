@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+import time
+
+from . import bot as core
+from .bot import BOT, ClanSize, Database
+
+__sqlite__ = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "..",
+    "..",
+    "database.sqlite",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clans (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    guild INTEGER
+);
+CREATE TABLE IF NOT EXISTS roles (
+    clan INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    icon TEXT,
+    discord INTEGER,
+    PRIMARY KEY (clan, id)
+);
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hidden INTEGER,
+    last_updated REAL,
+    discord INTEGER,
+    slug TEXT,
+    parents TEXT
+);
+CREATE TABLE IF NOT EXISTS parents (
+    player INTEGER NOT NULL REFERENCES players (id) ON DELETE CASCADE,
+    parent TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    player INTEGER NOT NULL REFERENCES players (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    clan INTEGER NOT NULL,
+    "primary" INTEGER,
+    role INTEGER
+);
+CREATE INDEX IF NOT EXISTS players_uuid ON players (uuid);
+CREATE INDEX IF NOT EXISTS players_name ON players (lower(name));
+CREATE INDEX IF NOT EXISTS players_discord ON players (discord);
+CREATE INDEX IF NOT EXISTS players_last_updated ON players (last_updated);
+CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent);
+CREATE INDEX IF NOT EXISTS parents_player ON parents (player);
+CREATE INDEX IF NOT EXISTS memberships_player ON memberships (player, position);
+CREATE INDEX IF NOT EXISTS memberships_clan_role ON memberships (clan, role);
+"""
+
+PLAYER_COLUMNS = "id, uuid, name, hidden, last_updated, discord, slug, parents"
+
+
+class SqliteDatabase(Database):
+    """
+    Keeps players and clans in SQLite instead of database.json. The JSON file
+    is only read for the rest of the config and for the one-shot migration.
+    Enabled with `"storage": "sqlite"` in database.json.
+    """
+
+    class Players(Database.Players):
+        def __init__(self, conn: sqlite3.Connection):
+            self.conn = conn
+
+        def __export__(self):
+            return [item.__export__() for item in self.__list__()]
+
+        def __list__(self):
+            return self._select("ORDER BY last_updated")
+
+        def __len__(self):
+            return self.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+        def _player(self, row: tuple, clans: list[dict]) -> Database.Players.Player:
+            return self.Player(
+                {
+                    "parents": json.loads(row[7]) if row[7] else None,
+                    "uuid": row[1],
+                    "name": row[2],
+                    "hidden": bool(row[3]),
+                    "last_updated": row[4],
+                    "discord": row[5],
+                    "slug": row[6],
+                    "clans": clans,
+                }
+            )
+
+        def _select(self, where: str, *params) -> list[Database.Players.Player]:
+            rows = self.conn.execute(
+                f"SELECT {PLAYER_COLUMNS} FROM players {where}", params
+            ).fetchall()
+            if not rows:
+                return []
+            clans: dict[int, list[dict]] = {row[0]: [] for row in rows}
+            for player, clan, primary, role in self.conn.execute(
+                'SELECT player, clan, "primary", role FROM memberships '
+                f"WHERE player IN (SELECT id FROM players {where}) ORDER BY position",
+                params,
+            ):
+                clans[player].append(
+                    {"clan": clan, "primary": bool(primary), "role": role}
+                )
+            return [self._player(row, clans[row[0]]) for row in rows]
+
+        def _first(self, where: str, *params) -> Database.Players.Player | None:
+            result = self._select(f"{where} ORDER BY id LIMIT 1", *params)
+            return result[0] if result else None
+
+        def _id(self, uuid: str) -> int | None:
+            row = self.conn.execute(
+                "SELECT id FROM players WHERE uuid = ? ORDER BY id LIMIT 1", (uuid,)
+            ).fetchone()
+            return row[0] if row else None
+
+        def insert(self, data: dict):
+            cursor = self.conn.execute(
+                "INSERT INTO players (uuid, name, hidden, last_updated, discord, slug, parents) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    data.get("uuid"),
+                    data.get("name"),
+                    bool(data.get("hidden")),
+                    data.get("last_updated") or time.time(),
+                    data.get("discord"),
+                    data.get("slug"),
+                    json.dumps(data.get("parents")) if data.get("parents") else None,
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO parents (player, parent) VALUES (?, ?)",
+                [(cursor.lastrowid, parent) for parent in data.get("parents") or []],
+            )
+            self.conn.executemany(
+                'INSERT INTO memberships (player, position, clan, "primary", role) '
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        cursor.lastrowid,
+                        position,
+                        clan.get("clan"),
+                        bool(clan.get("primary")),
+                        clan.get("role"),
+                    )
+                    for position, clan in enumerate(data.get("clans") or [])
+                ],
+            )
+
+        def apply(self, record: dict) -> bool:
+            match record.get("op"):
+                case "add":
+                    self.insert(record.get("player"))
+                    return True
+                case "set":
+                    return self.conn.execute(
+                        "UPDATE players SET name = ?, last_updated = ? WHERE id = ?",
+                        (
+                            record.get("name"),
+                            record.get("last_updated"),
+                            self._id(record.get("uuid")),
+                        ),
+                    ).rowcount > 0
+                case "update":
+                    player = self._id(record.get("uuid"))
+                    if player is None:
+                        return False
+                    self.conn.execute(
+                        "UPDATE players SET discord = ? WHERE id = ?",
+                        (record.get("discord"), player),
+                    )
+                    self.conn.execute(
+                        'INSERT INTO memberships (player, position, clan, "primary", role) '
+                        "SELECT ?, COALESCE(MAX(position) + 1, 0), ?, 0, ? "
+                        "FROM memberships WHERE player = ?",
+                        (player, record.get("clan"), record.get("role"), player),
+                    )
+                    return True
+                case "modify":
+                    return self.conn.execute(
+                        "UPDATE memberships SET role = ? WHERE rowid = ("
+                        "SELECT rowid FROM memberships WHERE player = ? AND clan = ? "
+                        "ORDER BY position LIMIT 1)",
+                        (
+                            record.get("role"),
+                            self._id(record.get("uuid")),
+                            record.get("clan"),
+                        ),
+                    ).rowcount > 0
+                case "delete":
+                    return self.conn.execute(
+                        "DELETE FROM players WHERE uuid = ?", (record.get("uuid"),)
+                    ).rowcount > 0
+                case "unify":
+                    return self.conn.execute(
+                        "DELETE FROM players WHERE id NOT IN "
+                        "(SELECT MIN(id) FROM players GROUP BY uuid)"
+                    ).rowcount > 0
+            return False
+
+        def set(self, index: int, value):
+            BOT.db.commit({
+                "op"          : "set",
+                "uuid"        : self._select(
+                    "ORDER BY last_updated LIMIT 1 OFFSET ?", index
+                )[0].uuid,
+                "name"        : value,
+                "last_updated": time.time(),
+            })
+
+        def in_clan(self, clan: int) -> list[Database.Players.Player]:
+            return self._select(
+                "WHERE id IN (SELECT player FROM memberships WHERE clan = ?) "
+                "ORDER BY last_updated",
+                clan,
+            )
+
+        def count_by_clan(self, clan: int) -> int:
+            return self.conn.execute(
+                "SELECT COUNT(DISTINCT player) FROM memberships WHERE clan = ?", (clan,)
+            ).fetchone()[0]
+
+        def breakdown(self, clan: int) -> ClanSize:
+            size = ClanSize(players=self.count_by_clan(clan))
+            for role, primary, alt, count in self.conn.execute(
+                'SELECT m.role, m."primary", p.parents IS NOT NULL, COUNT(*) '
+                "FROM memberships m JOIN players p ON p.id = m.player "
+                'WHERE m.clan = ? GROUP BY m.role, m."primary", p.parents IS NOT NULL',
+                (clan,),
+            ):
+                size.roles[role] = size.roles.get(role, 0) + count
+                if primary:
+                    size.primary += count
+                else:
+                    size.secondary += count
+                if alt:
+                    size.alts += count
+                else:
+                    size.mains += count
+            return size
+
+        def find_by_ign(self, ign: str) -> Database.Players.Player | None:
+            return self._first("WHERE lower(name) = ?", ign.lower())
+
+        def find_by_uuid(self, uuid: str) -> Database.Players.Player | None:
+            return self._first("WHERE uuid = ?", uuid)
+
+        def find_by_discord(self, index: int) -> Database.Players.Player | None:
+            return self._first("WHERE discord = ?", index)
+
+        def parents_of(self, player: Database.Players.Player) -> list[Database.Players.Player]:
+            if player._mains is None:
+                player._mains = [
+                    i for i in map(self.find_by_uuid, player.parents or []) if i
+                ]
+            return player._mains
+
+        def get_alts_by_uuid(
+            self, uuid: str
+        ) -> tuple[list[Database.Players.Player], list[Database.Players.Player]]:
+            """
+            :return: (PUBLIC[], PRIVATE[])
+            """
+            result = self._select(
+                "WHERE id IN (SELECT player FROM parents WHERE parent = ?) ORDER BY id",
+                uuid,
+            )
+            return (
+                [i for i in result if not i.hidden],
+                [i for i in result if i.hidden],
+            )
+
+        def sort(self):
+            # __list__() is always ordered by last_updated
+            pass
+
+    def __init__(self, data: dict, path: str = __sqlite__):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        fresh = not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'players'"
+        ).fetchone()
+        self.conn.executescript(SCHEMA)
+        if fresh:
+            if "players" not in data and os.path.exists(core.__snapshot__):
+                # With the binary snapshot on, database.json only holds the config
+                source = Database.open(data)
+                source.replay()
+                data = {**data, "players": source.players.__export__()}
+            self.migrate(data)
+        super().__init__({**data, "clans": self.load_clans(), "players": self.conn})
+
+    def load_clans(self) -> list[dict]:
+        clans = []
+        for clan_id, name, guild in self.conn.execute(
+            "SELECT id, name, guild FROM clans ORDER BY id"
+        ).fetchall():
+            clans.append(
+                {
+                    "id": clan_id,
+                    "name": name,
+                    "guild": guild,
+                    "roles": [
+                        {"id": role_id, "name": role, "icon": icon, "discord": discord}
+                        for role_id, role, icon, discord in self.conn.execute(
+                            "SELECT id, name, icon, discord FROM roles "
+                            "WHERE clan = ? ORDER BY rowid",
+                            (clan_id,),
+                        )
+                    ],
+                }
+            )
+        return clans
+
+    def migrate(self, data: dict):
+        """
+        One-shot import of the clans and players stored in database.json.
+        """
+        with self.conn:
+            for clan in data.get("clans") or []:
+                self.conn.execute(
+                    "INSERT INTO clans (id, name, guild) VALUES (?, ?, ?)",
+                    (clan.get("id"), clan.get("name"), clan.get("guild")),
+                )
+                self.conn.executemany(
+                    "INSERT INTO roles (clan, id, name, icon, discord) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            clan.get("id"),
+                            role.get("id"),
+                            role.get("name"),
+                            role.get("icon"),
+                            role.get("discord"),
+                        )
+                        for role in clan.get("roles") or []
+                    ],
+                )
+            players = self.Players(self.conn)
+            for player in data.get("players") or []:
+                players.insert(player)
+
+    def restore(self, data: dict):
+        with self.conn:
+            for table in ("memberships", "parents", "players", "roles", "clans"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.migrate(data)
+        self.clans = self.Clans(self.load_clans())
+        self.clan_relations = data.get("clan_relations")
+        self.revision += 1
+
+    def commit(self, record: dict):
+        if self.players.apply(record):
+            BOT.metrics.count("commits")
+            self.revision += 1
+        if self.batch is None:
+            self.append([record])
+
+    def append(self, records: list[dict]):
+        BOT.metrics.count("journal_writes")
+        self.conn.commit()
+
+    def replay(self) -> int:
+        # SQLite keeps its own write-ahead log
+        return 0
+
+    def flush(self):
+        self.dirty = False
+        self.conn.commit()
+
+    async def flush_async(self):
+        # A commit is cheap, and the connection belongs to the loop's thread
+        self.flush()
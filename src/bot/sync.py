@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+
+import discord
+
+from .bot import Database
+
+# Never synced (bot owner)
+IGNORED_MEMBERS = {465886354941673473}
+
+
+@dataclass
+class MemberDiff:
+    member: discord.Member
+    player: str
+    before: Database.Clans.Clan.Roles.Role | None
+    after: Database.Clans.Clan.Roles.Role | None
+
+    def __str__(self):
+        before = "???" if not self.before else self.before.name
+        if not self.after:
+            return f"- {self.member.mention} (`{self.player}`): no clan role"
+        return f"- {self.member.mention} (`{self.player}`): {before} → {self.after.name}"
+
+
+def sync_member(
+    db: Database, clan: Database.Clans.Clan, member: discord.Member
+) -> MemberDiff | None:
+    """
+    Copies the member's clan role from Discord into the database.
+    :return: the change, or None if the member isn't linked or nothing changed
+    """
+    if member.bot or member.id in IGNORED_MEMBERS:
+        return None
+    player = db.players.find_by_discord(member.id)
+    if not player:
+        return None
+    membership = next((c for c in player.clans.__list__() if c.clan == clan.id), None)
+    if not membership:
+        return None
+
+    role = db.get_role(clan.roles, member)
+    if role and role.id == membership.role:
+        return None
+    diff = MemberDiff(member, player.name, clan.roles.get(membership.role), role)
+    if role:
+        db.players.modify_by_uuid(player.uuid, clan.id, role.id)
+    return diff
+
+
+def sync_guild(
+    db: Database, clan: Database.Clans.Clan, guild: discord.Guild
+) -> list[MemberDiff]:
+    """
+    Syncs every member of the guild in one transaction (a single journal write).
+    """
+    diffs = []
+    with db.transaction():
+        for member in guild.members:
+            diff = sync_member(db, clan, member)
+            if diff:
+                diffs.append(diff)
+    return diffs
@@ -2,11 +2,24 @@ import json
 import os
 
 from bot import BOT, Database
+from bot.sqlite import SqliteDatabase
+
+
+def open_database(data: dict) -> Database:
+    database = Database.open(data)
+    database.replay()
+    return database
 
 
 if __name__ == "__main__":
     with open(os.path.join("..", "database.json"), "r") as fp:
         database = json.load(fp)
-    BOT.db = Database(database)
-    BOT.db.save()
+    if database.get("storage") == "sqlite":
+        BOT.db = SqliteDatabase(database)
+        BOT.db.replay()
+    else:
+        # Loaded in a worker thread once the loop runs, see Bot.load()
+        BOT.opener = lambda: open_database(database)
     BOT.run(database.get("token"))
+    if BOT.db is not None:
+        BOT.db.flush()